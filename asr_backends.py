@@ -0,0 +1,108 @@
+import re
+import threading
+import time
+
+from audio_pcm import SAMPLE_RATE
+
+ASR_BACKENDS = ('hf', 'hf-int8', 'ctranslate2')
+WORD_EDGE_PATTERN = re.compile(r'[0-9A-Za-z]')
+
+
+def join_segment_texts(segments):
+    """合併段落文字：中文直接相接，前後都是英數字時才補上空格"""
+    text = ''
+    for segment in segments:
+        if text and segment['text'] and WORD_EDGE_PATTERN.match(text[-1]) and WORD_EDGE_PATTERN.match(segment['text'][0]):
+            text += ' '
+        text += segment['text']
+    return text
+
+
+class HFWhisperBackend:
+    """Hugging Face transformers 的 Whisper pipeline
+
+    quantize 為 True 時在 CPU 上以動態 int8 量化所有 Linear 層，速度較快、準確度略降。
+    """
+
+    def __init__(self, model_id, threads=None, quantize=False):
+        import torch
+        from transformers import AutoModelForSpeechSeq2Seq, AutoProcessor, pipeline
+
+        if threads:
+            torch.set_num_threads(threads)
+        use_cuda = torch.cuda.is_available() and not quantize
+        device = "cuda:0" if use_cuda else "cpu"
+        torch_dtype = torch.float16 if use_cuda else torch.float32
+
+        model = AutoModelForSpeechSeq2Seq.from_pretrained(
+            model_id, torch_dtype=torch_dtype, use_safetensors=True
+        )
+        if quantize:
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        model.to(device)
+
+        processor = AutoProcessor.from_pretrained(model_id)
+
+        self.pipe = pipeline(
+            "automatic-speech-recognition",
+            model=model,
+            tokenizer=processor.tokenizer,
+            feature_extractor=processor.feature_extractor,
+            max_new_tokens=128,
+            chunk_length_s=15,
+            batch_size=16,
+            torch_dtype=torch_dtype,
+            device=device,
+        )
+
+    def transcribe(self, audio):
+        result = self.pipe({'raw': audio, 'sampling_rate': SAMPLE_RATE}, return_timestamps=True)
+        segments = [{'start': chunk['timestamp'][0], 'end': chunk['timestamp'][1], 'text': chunk['text'].strip()}
+                    for chunk in result.get("chunks", []) if chunk['timestamp'][0] is not None]
+        return result["text"], segments
+
+
+class CTranslate2WhisperBackend:
+    """以 CTranslate2（faster-whisper）執行的 int8 Whisper，CPU 上通常是最快的選項"""
+
+    def __init__(self, model_name, threads=None):
+        from faster_whisper import WhisperModel
+
+        self.model = WhisperModel(model_name, device='cpu', compute_type='int8', cpu_threads=threads or 0)
+
+    def transcribe(self, audio):
+        # 人聲偵測已在前一步完成，這裡不再重複過濾
+        segments, _ = self.model.transcribe(audio, beam_size=1, vad_filter=False)
+        segments = [{'start': segment.start, 'end': segment.end, 'text': segment.text.strip()} for segment in segments]
+        return join_segment_texts(segments), segments
+
+
+def resolve_model_name(backend, model):
+    """模型可以只寫大小（例如 small、medium），或寫完整的模型名稱"""
+    if '/' in model or backend == 'ctranslate2':
+        return model
+    return f"openai/whisper-{model}"
+
+
+# 常駐的轉錄模型：同一程序內（CLI 批次或 UI 的下載執行緒）只載入一次
+_asr_backends = {}
+_asr_backend_lock = threading.Lock()
+
+
+def get_asr_backend(backend='hf', model='medium', threads=None):
+    """取得已載入的語音辨識模型，第一次呼叫時才建立並快取；各模型的 transcribe(audio) 都返回 (文字, 段落列表)"""
+    key = (backend, model, threads)
+    with _asr_backend_lock:
+        if key in _asr_backends:
+            return _asr_backends[key]
+
+        load_start = time.time()
+        model_name = resolve_model_name(backend, model)
+        if backend == 'ctranslate2':
+            asr_backend = CTranslate2WhisperBackend(model_name, threads)
+        else:
+            asr_backend = HFWhisperBackend(model_name, threads, quantize=backend == 'hf-int8')
+
+        _asr_backends[key] = asr_backend
+        print(f"已載入轉錄模型 {model_name}（{backend}），耗時 {time.time() - load_start:.2f} 秒")
+        return asr_backend
@@ -0,0 +1,23 @@
+import subprocess
+
+import numpy as np
+
+# Whisper 的特徵擷取器需要 16 kHz 單聲道的音訊
+SAMPLE_RATE = 16000
+
+
+def decode_audio(audio_file, sample_rate=SAMPLE_RATE):
+    """以 ffmpeg 將音訊直接解碼成單聲道 float32 PCM
+
+    解碼結果經由管線讀回記憶體，不需要先轉成 MP3 或寫出暫存的 wav 檔。
+    """
+    command = [
+        'ffmpeg', '-nostdin', '-loglevel', 'error',
+        '-i', audio_file,
+        '-vn', '-ac', '1', '-ar', str(sample_rate),
+        '-f', 'f32le', 'pipe:1',
+    ]
+    process = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg 解碼失敗：{process.stderr.decode('utf-8', errors='replace').strip()}")
+    return np.frombuffer(process.stdout, dtype=np.float32)
@@ -0,0 +1,113 @@
+import argparse
+import asyncio
+import os
+import time
+from pathlib import Path
+
+from llm_provider import LLMProvider
+from metadata_store import open_metadata_store
+from response_cache import ResponseCache
+from summarizer import MapReduceSummarizer
+
+DEFAULT_MODELS = {'groq': 'llama-3.1-70b-versatile', 'openai': 'gpt-4o-mini'}
+
+
+class BatchSummarizer:
+    """背景批次生成摘要：掃描沒有摘要的影片，以非同步工作池送出請求並逐筆寫回"""
+
+    def __init__(self, metadata_store, provider, model, cache=None, workers=3):
+        self.metadata_store = metadata_store
+        self.provider = provider  # LLMProvider，已包含限速與重試
+        self.model = model
+        self.cache = cache
+        self.workers = workers
+        self.loop = None
+
+    def complete_from_thread(self, messages):
+        # 分段摘要在執行緒中進行，實際的 API 請求交回事件迴圈統一限速
+        return asyncio.run_coroutine_threadsafe(self.provider.complete(self.model, messages), self.loop).result()
+
+    async def summarize_video(self, video):
+        transcript = await asyncio.to_thread(Path(video['transcript_path']).read_text, encoding='utf-8')
+        summarizer = MapReduceSummarizer(
+            self.complete_from_thread,
+            lambda messages: iter([self.complete_from_thread(messages)]),
+            self.model,
+            cache=self.cache,
+        )
+        summary = await asyncio.to_thread(summarizer.summarize, transcript)
+        self.metadata_store.set_summary(video['video_id'], summary)
+
+    async def worker(self, queue, stats):
+        while True:
+            video = await queue.get()
+            try:
+                start_time = time.time()
+                await self.summarize_video(video)
+                stats['done'] += 1
+                print(f"摘要完成（{time.time() - start_time:.1f} 秒）：{video['channel_name']} / {video['title']}")
+            except Exception as e:
+                stats['failed'] += 1
+                print(f"摘要失敗：{video['title']}：{e}")
+            finally:
+                queue.task_done()
+
+    async def run_once(self):
+        self.loop = asyncio.get_running_loop()
+        videos = self.metadata_store.get_videos_without_summary()
+        print(f"尚未生成摘要的影片：{len(videos)} 部")
+        if not videos:
+            return
+
+        queue = asyncio.Queue()
+        for video in videos:
+            queue.put_nowait(video)
+        stats = {'done': 0, 'failed': 0}
+        workers = [asyncio.create_task(self.worker(queue, stats)) for _ in range(self.workers)]
+        await queue.join()
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        print(f"本輪完成 {stats['done']} 部，失敗 {stats['failed']} 部")
+
+
+async def run(args):
+    api_key = args.api_key or os.environ.get('OPENAI_API_KEY' if args.provider == 'openai' else 'GROQ_API_KEY')
+    if not api_key:
+        raise SystemExit("請以 --api_key 或環境變數 GROQ_API_KEY / OPENAI_API_KEY 提供 API 金鑰")
+
+    metadata_store = open_metadata_store(args.metadata_path)
+    provider = LLMProvider(args.provider, api_key, base_url=args.base_url, requests_per_minute=args.requests_per_minute)
+    batch_summarizer = BatchSummarizer(
+        metadata_store,
+        provider,
+        args.model or DEFAULT_MODELS[args.provider],
+        cache=ResponseCache(os.path.join(os.path.dirname(args.metadata_path) or '.', 'response_cache.db')),
+        workers=args.workers,
+    )
+    try:
+        while True:
+            await batch_summarizer.run_once()
+            if not args.daemon:
+                break
+            await asyncio.sleep(args.interval)
+    finally:
+        await provider.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="為尚未有摘要的影片批次生成摘要並寫回元數據")
+    parser.add_argument('--provider', choices=['groq', 'openai'], default='groq', help="使用的 API，預設為 groq")
+    parser.add_argument('--model', help="模型名稱，預設 groq 為 llama-3.1-70b-versatile、openai 為 gpt-4o-mini")
+    parser.add_argument('--api_key', help="API 金鑰，未指定時讀取環境變數 GROQ_API_KEY 或 OPENAI_API_KEY")
+    parser.add_argument('--base_url', help="自訂 API 網址（相容 OpenAI 介面的服務或本地測試伺服器）")
+    parser.add_argument('--metadata_path', default='./transcriptions/metadata.db', help="元數據資料庫位置，預設為 './transcriptions/metadata.db'")
+    parser.add_argument('--workers', type=int, default=3, help="同時處理的影片數，預設為 3")
+    parser.add_argument('--requests_per_minute', type=float, default=30, help="每分鐘最多送出的請求數，預設為 30")
+    parser.add_argument('--daemon', action='store_true', help="持續執行，每隔 --interval 秒掃描一次新影片")
+    parser.add_argument('--interval', type=int, default=600, help="常駐模式下的掃描間隔秒數，預設為 600")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
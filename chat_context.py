@@ -0,0 +1,91 @@
+import threading
+from functools import lru_cache
+
+from summarizer import estimate_tokens
+
+FOLD_PROMPT = "以下是使用者與助手先前的對話，可能附有更早對話的摘要。請以繁體中文整理成一份簡潔的摘要，保留使用者關心的問題、提到的企業，以及助手給出的重要結論，供後續對話參考。只輸出摘要內容，不要有任何額外的說明。"
+
+
+@lru_cache(maxsize=None)
+def _get_encoding(model):
+    """取得模型的 tokenizer；未安裝 tiktoken 或不認得的模型（例如 llama）返回 None"""
+    try:
+        import tiktoken
+        return tiktoken.encoding_for_model(model)
+    except (ImportError, KeyError):
+        return None
+
+
+def count_tokens(text, model):
+    """計算文字在指定模型下的 token 數，無法精確計算時改用粗估"""
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text))
+
+
+class ChatContext:
+    """一部影片的聊天紀錄與送出時的上下文
+
+    turns 保存完整的對話（供顯示）；送出請求時只附上最近 recent_turns 則、且總長不超過
+    history_tokens 的訊息，更早的對話折疊成一份滾動摘要，讓每一輪的提示長度大致固定。
+    """
+
+    def __init__(self, turns=None, summary="", summarized_count=0, recent_turns=6, history_tokens=1500, journal=None):
+        self.turns = list(turns or [])
+        self.summary = summary  # 已折疊對話的摘要
+        self.summarized_count = summarized_count  # turns 中已折疊進摘要的訊息數
+        self.recent_turns = recent_turns
+        self.history_tokens = history_tokens
+        self.journal = journal  # journal(record)：每次變更時呼叫，用來逐筆寫入磁碟
+        self.lock = threading.Lock()
+
+    def add(self, role, content):
+        with self.lock:
+            self.turns.append({"role": role, "content": content})
+        if self.journal:
+            self.journal({"type": "message", "role": role, "content": content})
+
+    def _recent_start(self, turns, model):
+        """最近視窗的起點：最多 recent_turns 則，且總 token 數不超過預算（至少保留最後一則）"""
+        start = len(turns)
+        total = 0
+        while start > 0 and len(turns) - start < self.recent_turns:
+            tokens = count_tokens(turns[start - 1]["content"], model)
+            if start < len(turns) and total + tokens > self.history_tokens:
+                break
+            total += tokens
+            start -= 1
+        return start
+
+    def prompt_history(self, model, complete, turn_count=None):
+        """返回 (滾動摘要, 最近的訊息)；視窗外尚未折疊的訊息會先以 complete(messages) 併入摘要
+
+        turn_count 為送出問題當下的訊息數，之後才加入的訊息不會帶入這次請求。在工作執行緒中呼叫；
+        同一份紀錄同時有多個請求折疊時，只採用第一個完成的結果。
+        """
+        with self.lock:
+            turns = self.turns[:turn_count]
+            summary = self.summary
+            summarized_count = self.summarized_count
+        start = max(self._recent_start(turns, model), summarized_count)
+
+        if start > summarized_count:
+            # 一次折疊到只剩半個視窗，之後幾輪不需要再額外呼叫模型
+            start = max(start, len(turns) - max(1, self.recent_turns // 2))
+            dialogue = "\n".join(
+                f"{'使用者' if turn['role'] == 'user' else '助手'}: {turn['content']}"
+                for turn in turns[summarized_count:start]
+            )
+            summary = complete([
+                {"role": "system", "content": FOLD_PROMPT},
+                {"role": "user", "content": (f"先前對話摘要:\n{summary}\n\n" if summary else "") + "對話:\n" + dialogue},
+            ])
+            with self.lock:
+                adopted = self.summarized_count == summarized_count
+                if adopted:
+                    self.summary = summary
+                    self.summarized_count = start
+            if adopted and self.journal:
+                self.journal({"type": "summary", "summary": summary, "summarized_count": start})
+        return summary, turns[start:]
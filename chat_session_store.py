@@ -0,0 +1,48 @@
+import hashlib
+import os
+import threading
+from datetime import datetime
+
+from chat_context import ChatContext
+from jsonl_file import append_jsonl, read_jsonl
+
+
+class ChatSessionStore:
+    """聊天紀錄的磁碟儲存，每份逐字稿一個只會附加寫入的 JSONL 檔
+
+    每則訊息（以及折疊後的對話摘要）各寫成一行，寫入時只附加不改寫；
+    選到影片時才讀取該影片的紀錄。程式中途結束時最後一行可能不完整，讀取時略過。
+    """
+
+    def __init__(self, session_dir='./transcriptions/.chat_sessions'):
+        self.session_dir = session_dir
+        self.lock = threading.Lock()
+
+    def _session_path(self, transcript_path):
+        key = hashlib.sha1(os.path.abspath(transcript_path).encode('utf-8')).hexdigest()
+        return os.path.join(self.session_dir, key + '.jsonl')
+
+    def load(self, transcript_path, **context_options):
+        """讀取逐字稿的聊天紀錄，返回之後的變更會自動寫回磁碟的 ChatContext"""
+        turns = []
+        summary = ""
+        summarized_count = 0
+        for record in read_jsonl(self._session_path(transcript_path)):
+            if record['type'] == 'message':
+                turns.append({"role": record['role'], "content": record['content']})
+            elif record['type'] == 'summary':
+                summary = record['summary']
+                summarized_count = record['summarized_count']
+        return ChatContext(
+            turns,
+            summary=summary,
+            summarized_count=min(summarized_count, len(turns)),
+            journal=lambda record: self.append(transcript_path, record),
+            **context_options,
+        )
+
+    def append(self, transcript_path, record):
+        record = dict(record, time=datetime.now().isoformat(timespec='seconds'))
+        with self.lock:
+            os.makedirs(self.session_dir, exist_ok=True)
+            append_jsonl(self._session_path(transcript_path), record)
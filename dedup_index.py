@@ -0,0 +1,75 @@
+from collections import Counter, defaultdict
+from difflib import SequenceMatcher
+from urllib.parse import urlparse, parse_qs
+
+
+def extract_video_id(video_url):
+    """從 YouTube 網址取出影片 ID，無法辨識時返回 None"""
+    if not video_url:
+        return None
+    parsed = urlparse(video_url)
+    if parsed.hostname and parsed.hostname.endswith('youtu.be'):
+        return parsed.path.lstrip('/') or None
+    query_id = parse_qs(parsed.query).get('v')
+    if query_id:
+        return query_id[0]
+    parts = [part for part in parsed.path.split('/') if part]
+    if len(parts) == 2 and parts[0] in ('shorts', 'live', 'embed'):
+        return parts[1]
+    return None
+
+
+def title_ngrams(title, n=3):
+    """將標題切成字元 n-gram（忽略空白與大小寫），過短的標題直接當成一個 n-gram"""
+    text = ''.join(title.lower().split())
+    if len(text) <= n:
+        return {text}
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+class DedupIndex:
+    """影片去重索引
+
+    以影片 ID 做精確比對；標題近似比對則透過字元三元組倒排索引先挑出少量候選，
+    再以 SequenceMatcher 驗證，不需要和頻道內每一個既有標題逐一比較。
+    """
+
+    def __init__(self, threshold=0.7, max_candidates=10):
+        self.threshold = threshold
+        self.max_candidates = max_candidates
+        self.video_ids = set()
+        self.titles = []  # 索引編號 -> 標題
+        self.postings = defaultdict(set)  # (頻道名稱, n-gram) -> 標題索引編號
+
+    @classmethod
+    def from_metadata(cls, metadata, **kwargs):
+        """由元數據建立索引；舊資料沒有 video_id 時改由 original_url 推得"""
+        index = cls(**kwargs)
+        for channel_name, videos in metadata.items():
+            for video_title, video_info in videos.items():
+                video_id = video_info.get('video_id') or extract_video_id(video_info.get('original_url'))
+                index.add(channel_name, video_title, video_id)
+        return index
+
+    def add(self, channel_name, video_title, video_id=None):
+        if video_id:
+            self.video_ids.add(video_id)
+        title_id = len(self.titles)
+        self.titles.append(video_title)
+        for gram in title_ngrams(video_title):
+            self.postings[(channel_name, gram)].add(title_id)
+
+    def contains_id(self, video_id):
+        return video_id is not None and video_id in self.video_ids
+
+    def find_similar(self, channel_name, video_title):
+        """返回同頻道中與標題相似度達到門檻的既有標題，沒有則返回 None"""
+        shared_counts = Counter()
+        for gram in title_ngrams(video_title):
+            shared_counts.update(self.postings.get((channel_name, gram), ()))
+
+        for title_id, _ in shared_counts.most_common(self.max_candidates):
+            existing_title = self.titles[title_id]
+            if SequenceMatcher(None, video_title, existing_title).ratio() >= self.threshold:
+                return existing_title
+        return None
@@ -0,0 +1,31 @@
+import json
+import os
+
+
+def read_jsonl(path):
+    """讀取只會附加寫入的 JSONL 檔；程式中途結束時最後一行可能不完整，讀取時略過"""
+    records = []
+    if not os.path.exists(path):
+        return records
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return records
+
+
+def append_jsonl(path, record, sync=False):
+    """附加一筆紀錄；sync 為 True 時寫入後立即同步到磁碟"""
+    line = (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')
+    with open(path, 'a+b') as f:
+        # 上次寫到一半中斷時，先換行避免與不完整的那一行接在一起
+        if f.seek(0, os.SEEK_END) > 0:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b'\n':
+                line = b'\n' + line
+        f.write(line)
+        if sync:
+            f.flush()
+            os.fsync(f.fileno())
@@ -0,0 +1,270 @@
+import asyncio
+import concurrent.futures
+import json
+import queue
+import random
+import threading
+import time
+
+import httpx
+
+# Groq 與 OpenAI 都提供相容的 chat/completions 介面，只有網址與速率限制不同
+PROVIDER_DEFAULTS = {
+    'groq': {'base_url': 'https://api.groq.com/openai/v1', 'requests_per_minute': 30},
+    'openai': {'base_url': 'https://api.openai.com/v1', 'requests_per_minute': 500},
+}
+RETRYABLE_STATUS_CODES = (408, 409, 429, 500, 502, 503, 504)
+
+
+class ProviderError(Exception):
+    def __init__(self, message, status_code=None, retry_after=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class RequestCancelled(Exception):
+    """請求已被呼叫端取消"""
+
+
+class RequestScope:
+    """一次請求（可能包含多個 API 呼叫）的取消範圍
+
+    範圍內送出的 API 呼叫都會登記在這裡；cancel() 會取消仍在進行中的協程，
+    連帶中斷底層的 HTTP 連線，而不需要強制終止執行緒。
+    """
+
+    def __init__(self):
+        self.cancelled = False
+        self.futures = set()
+        self.lock = threading.Lock()
+
+    def cancel(self):
+        with self.lock:
+            self.cancelled = True
+            futures = list(self.futures)
+        for future in futures:
+            future.cancel()
+
+    def check(self):
+        if self.cancelled:
+            raise RequestCancelled()
+
+    def track(self, future):
+        with self.lock:
+            if not self.cancelled:
+                self.futures.add(future)
+                return
+        future.cancel()
+        raise RequestCancelled()
+
+    def untrack(self, future):
+        with self.lock:
+            self.futures.discard(future)
+
+
+class TokenBucket:
+    """令牌桶限速：平均每秒 rate 個請求，最多累積 capacity 個以容許短暫突發"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class LLMProvider:
+    """非同步的 LLM 請求介面（Groq / OpenAI 共用）
+
+    同一個 provider 共用一個連線池與令牌桶；遇到 429、5xx 或連線錯誤時以指數退避加隨機抖動重試，
+    並優先採用伺服器回傳的 retry-after。base_url 可指向本地的假伺服器做測試。
+    """
+
+    def __init__(self, name, api_key, base_url=None, requests_per_minute=None, timeout=60.0, max_retries=5):
+        defaults = PROVIDER_DEFAULTS[name]
+        self.name = name
+        self.base_url = (base_url or defaults['base_url']).rstrip('/')
+        rate = (requests_per_minute or defaults['requests_per_minute']) / 60.0
+        self.rate_limiter = TokenBucket(rate, capacity=max(1.0, rate * 10))
+        self.max_retries = max_retries
+        self.client = httpx.AsyncClient(
+            headers={'Authorization': f'Bearer {api_key}'},
+            timeout=httpx.Timeout(timeout, connect=10.0),
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+        )
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    async def complete(self, model, messages):
+        """送出請求並返回完整回覆"""
+        async def attempt():
+            response = await self.client.post(f'{self.base_url}/chat/completions', json={'model': model, 'messages': messages})
+            await self._raise_for_status(response)
+            return response.json()['choices'][0]['message']['content'].strip()
+        return await self._with_retries(attempt)
+
+    async def stream(self, model, messages):
+        """以串流方式逐段產生回覆；只有在尚未收到任何內容前才會重試"""
+        for attempt_number in range(self.max_retries + 1):
+            await self.rate_limiter.acquire()
+            received = False
+            try:
+                payload = {'model': model, 'messages': messages, 'stream': True}
+                async with self.client.stream('POST', f'{self.base_url}/chat/completions', json=payload) as response:
+                    await self._raise_for_status(response)
+                    async for line in response.aiter_lines():
+                        if not line.startswith('data:'):
+                            continue
+                        data = line[len('data:'):].strip()
+                        if data == '[DONE]':
+                            return
+                        choices = json.loads(data).get('choices') or [{}]
+                        content = choices[0].get('delta', {}).get('content')
+                        if content:
+                            received = True
+                            yield content
+                return
+            except Exception as e:
+                if received or not await self._should_retry(e, attempt_number):
+                    raise
+
+    async def _with_retries(self, attempt):
+        for attempt_number in range(self.max_retries + 1):
+            await self.rate_limiter.acquire()
+            try:
+                return await attempt()
+            except Exception as e:
+                if not await self._should_retry(e, attempt_number):
+                    raise
+
+    async def _should_retry(self, error, attempt_number):
+        """判斷是否重試；需要重試時先等待退避時間"""
+        if attempt_number >= self.max_retries:
+            return False
+        if isinstance(error, ProviderError):
+            if error.status_code not in RETRYABLE_STATUS_CODES:
+                return False
+            delay = error.retry_after
+        elif isinstance(error, (httpx.TransportError, httpx.TimeoutException)):
+            delay = None
+        else:
+            return False
+        if delay is None:
+            delay = min(60, 2 ** attempt_number) + random.uniform(0, 1)
+        print(f"{self.name} 請求失敗（{error}），{delay:.1f} 秒後重試")
+        await asyncio.sleep(delay)
+        return True
+
+    @staticmethod
+    async def _raise_for_status(response):
+        if response.status_code == 200:
+            return
+        body = (await response.aread()).decode('utf-8', errors='replace')
+        try:
+            retry_after = float(response.headers.get('retry-after'))
+        except (TypeError, ValueError):
+            retry_after = None
+        raise ProviderError(f"HTTP {response.status_code}: {body[:200]}", response.status_code, retry_after)
+
+
+class ProviderLoop:
+    """在背景執行緒中運行的事件迴圈，讓同步程式碼（QThread、執行緒池）共用同一組 provider"""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name='llm-provider-loop', daemon=True)
+        self.thread.start()
+        self.providers = {}
+        self.lock = threading.Lock()
+
+    def submit(self, coroutine):
+        """排入一個協程，返回 concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def get_client(self, name, api_key, **kwargs):
+        """取得（必要時建立）指定 provider 的同步介面；相同金鑰共用連線池與速率限制"""
+        with self.lock:
+            key = (name, api_key)
+            if key not in self.providers:
+                async def create():
+                    return LLMProvider(name, api_key, **kwargs)
+                self.providers[key] = SyncProviderClient(self.submit(create()).result(), self)
+            return self.providers[key]
+
+
+class SyncProviderClient:
+    """LLMProvider 的同步包裝"""
+
+    def __init__(self, provider, provider_loop):
+        self.provider = provider
+        self.provider_loop = provider_loop
+
+    def complete(self, model, messages, scope=None):
+        future = self.provider_loop.submit(self.provider.complete(model, messages))
+        if scope is None:
+            return future.result()
+        scope.track(future)
+        try:
+            return future.result()
+        except concurrent.futures.CancelledError:
+            raise RequestCancelled()
+        finally:
+            scope.untrack(future)
+
+    def stream(self, model, messages, scope=None):
+        """逐段產生回覆；呼叫端提前停止迭代或取消 scope 時會取消底層的 HTTP 請求"""
+        chunks = queue.Queue()
+        done = object()
+
+        async def pump():
+            try:
+                async for chunk in self.provider.stream(model, messages):
+                    chunks.put(chunk)
+            except Exception as e:
+                chunks.put(e)
+            finally:
+                chunks.put(done)
+
+        future = self.provider_loop.submit(pump())
+        if scope is not None:
+            scope.track(future)
+        try:
+            while True:
+                item = chunks.get()
+                if item is done:
+                    if scope is not None:
+                        scope.check()  # 被取消時不要把不完整的回覆當成結果
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            if not future.done():
+                future.cancel()
+            if scope is not None:
+                scope.untrack(future)
+
+
+_provider_loop = None
+_provider_loop_lock = threading.Lock()
+
+
+def get_provider_loop():
+    global _provider_loop
+    with _provider_loop_lock:
+        if _provider_loop is None:
+            _provider_loop = ProviderLoop()
+        return _provider_loop
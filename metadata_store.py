@@ -0,0 +1,162 @@
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+from dedup_index import extract_video_id
+
+
+class MetadataStore:
+    """以 SQLite（WAL 模式）儲存影片元數據
+
+    每部影片一列，以影片 ID 為主鍵逐筆 upsert，不再整份改寫 metadata.json；
+    CLI 與 UI 可同時開啟同一個資料庫，寫入以交易方式完成。
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("PRAGMA busy_timeout=30000")
+        with self.connection:
+            self.connection.executescript("""
+                CREATE TABLE IF NOT EXISTS videos (
+                    video_id TEXT PRIMARY KEY,
+                    channel_name TEXT NOT NULL,
+                    title TEXT NOT NULL,
+                    upload_date TEXT,
+                    original_url TEXT,
+                    transcript_path TEXT,
+                    summary TEXT,
+                    updated_at TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS videos_channel ON videos (channel_name, upload_date);
+                CREATE TABLE IF NOT EXISTS sync_state (
+                    channel_url TEXT PRIMARY KEY,
+                    last_video_id TEXT,
+                    last_upload_date TEXT,
+                    synced_at TEXT NOT NULL
+                );
+            """)
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    def upsert_video(self, channel_name, video_title, upload_date, original_url, transcript_path, video_id=None):
+        """新增或更新一部影片的元數據（保留已存在的摘要）"""
+        video_id = video_id or extract_video_id(original_url) or f"{channel_name}/{video_title}"
+        with self.lock, self.connection:
+            self.connection.execute("""
+                INSERT INTO videos (video_id, channel_name, title, upload_date, original_url, transcript_path, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (video_id) DO UPDATE SET
+                    channel_name = excluded.channel_name,
+                    title = excluded.title,
+                    upload_date = excluded.upload_date,
+                    original_url = excluded.original_url,
+                    transcript_path = excluded.transcript_path,
+                    updated_at = excluded.updated_at
+            """, (video_id, channel_name, video_title, upload_date, original_url, transcript_path, _now()))
+        return video_id
+
+    def set_summary(self, video_id, summary):
+        with self.lock, self.connection:
+            self.connection.execute(
+                "UPDATE videos SET summary = ?, updated_at = ? WHERE video_id = ?",
+                (summary, _now(), video_id),
+            )
+
+    def load_grouped(self):
+        """返回與舊版 metadata.json 相同結構的字典：{頻道名稱: {影片標題: 影片資訊}}"""
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT * FROM videos ORDER BY channel_name, upload_date DESC"
+            ).fetchall()
+        grouped = {}
+        for row in rows:
+            video_info = {
+                'video_id': row['video_id'],
+                'upload_date': row['upload_date'],
+                'original_url': row['original_url'],
+                'transcript_path': row['transcript_path'],
+            }
+            if row['summary'] is not None:
+                video_info['summary'] = row['summary']
+            grouped.setdefault(row['channel_name'], {})[row['title']] = video_info
+        return grouped
+
+    def get_videos_without_summary(self):
+        """返回尚未有摘要的影片（由新到舊）"""
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT video_id, channel_name, title, transcript_path FROM videos "
+                "WHERE summary IS NULL AND transcript_path IS NOT NULL ORDER BY upload_date DESC"
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def get_sync_state(self, channel_url):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT * FROM sync_state WHERE channel_url = ?", (channel_url,)
+            ).fetchone()
+        return dict(row) if row else {}
+
+    def set_sync_state(self, channel_url, last_video_id, last_upload_date):
+        with self.lock, self.connection:
+            self.connection.execute("""
+                INSERT INTO sync_state (channel_url, last_video_id, last_upload_date, synced_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (channel_url) DO UPDATE SET
+                    last_video_id = excluded.last_video_id,
+                    last_upload_date = excluded.last_upload_date,
+                    synced_at = excluded.synced_at
+            """, (channel_url, last_video_id, last_upload_date, _now()))
+
+    def import_json(self, json_path, sync_state_path=None):
+        """一次性匯入舊版 metadata.json（及 sync_state.json）"""
+        imported = 0
+        if os.path.exists(json_path):
+            with open(json_path, 'r', encoding='utf-8') as f:
+                metadata = json.load(f)
+            for channel_name, videos in metadata.items():
+                for video_title, video_info in videos.items():
+                    video_id = self.upsert_video(
+                        channel_name, video_title, video_info.get('upload_date'), video_info.get('original_url'),
+                        video_info.get('transcript_path'), video_info.get('video_id'),
+                    )
+                    if 'summary' in video_info:
+                        self.set_summary(video_id, video_info['summary'])
+                    imported += 1
+        if sync_state_path and os.path.exists(sync_state_path):
+            with open(sync_state_path, 'r', encoding='utf-8') as f:
+                sync_state = json.load(f)
+            for channel_url, state in sync_state.items():
+                self.set_sync_state(channel_url, state.get('last_video_id'), state.get('last_upload_date'))
+        return imported
+
+
+def open_metadata_store(metadata_path):
+    """開啟元數據資料庫；第一次建立時自動匯入同目錄下的舊版 JSON 檔案
+
+    metadata_path 可以是 .db 檔，也可以沿用舊的 metadata.json 路徑（會改用同名的 .db 檔）。
+    """
+    base_path = os.path.splitext(metadata_path)[0]
+    db_path = base_path + '.db'
+    is_new = not os.path.exists(db_path)
+    store = MetadataStore(db_path)
+    if is_new:
+        json_path = base_path + '.json'
+        sync_state_path = os.path.join(os.path.dirname(db_path) or '.', 'sync_state.json')
+        imported = store.import_json(json_path, sync_state_path)
+        if imported:
+            print(f"已從 {json_path} 匯入 {imported} 筆元數據到 {db_path}")
+    return store
+
+
+def _now():
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
@@ -0,0 +1,166 @@
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from asr_backends import get_asr_backend, join_segment_texts
+from audio_pcm import SAMPLE_RATE
+from voice_activity import frame_energy_db
+
+
+def split_at_silence(audio, part_seconds, search_seconds=5.0, sample_rate=SAMPLE_RATE, frame_seconds=0.03):
+    """將音訊切成約 part_seconds 長的片段，每個切點選在預定位置前後 search_seconds 內最安靜的音框"""
+    part_samples = int(part_seconds * sample_rate)
+    search_samples = int(search_seconds * sample_rate)
+    frame_samples = int(frame_seconds * sample_rate)
+    cuts = [0]
+    target = part_samples
+    while target < len(audio) - part_samples // 2:
+        window_start = max(cuts[-1] + frame_samples, target - search_samples)
+        window = audio[window_start:min(len(audio), target + search_samples)]
+        if len(window) >= frame_samples:
+            quietest = int(np.argmin(frame_energy_db(window, frame_samples)))
+            cut = window_start + quietest * frame_samples + frame_samples // 2
+        else:
+            cut = target
+        cuts.append(cut)
+        target = cut + part_samples
+    cuts.append(len(audio))
+    return list(zip(cuts[:-1], cuts[1:]))
+
+
+def _merge_crossing_segment(previous, segment):
+    """合併橫跨切點、被前後兩個片段各轉錄一次的段落
+
+    重疊的字以前一段結尾與後一段開頭相同的文字找出；找不到相同文字時（兩邊辨識結果略有不同），
+    依重疊時間佔後一段的比例略去後一段開頭的字。
+    """
+    text = segment['text']
+    overlap = 0
+    for length in range(min(len(previous['text']), len(text)), 1, -1):
+        if previous['text'].endswith(text[:length]):
+            overlap = length
+            break
+    else:
+        duration = (segment['end'] or previous['end']) - segment['start']
+        if duration > 0:
+            overlap = round(len(text) * min(1.0, (previous['end'] - segment['start']) / duration))
+    previous['text'] = join_segment_texts([previous, {'text': text[overlap:].lstrip()}])
+    if segment['end'] is None or segment['end'] > previous['end']:
+        previous['end'] = segment['end']
+
+
+def join_part_segments(parts, tolerance=0.2):
+    """依序合併各片段的結果
+
+    parts 為 [(核心開始秒數, 核心結束秒數, 段落列表)]；片段前後都多轉錄了一小段重疊的音訊。
+    完全落在前後片段重疊區內的段落由相鄰片段負責，直接略去；橫跨切點的句子兩邊都會轉錄到，
+    與前一個保留的段落時間重疊時合併成一段並去除重複的字，邊界上的字不會遺失或重複。
+    """
+    segments = []
+    for core_start, core_end, part_segments in parts:
+        for segment in part_segments:
+            end = segment['end'] if segment['end'] is not None else core_end
+            if end <= core_start + tolerance or segment['start'] >= core_end - tolerance:
+                continue
+            if segments and segments[-1]['end'] is not None and segment['start'] < segments[-1]['end'] - tolerance:
+                _merge_crossing_segment(segments[-1], segment)
+            else:
+                segments.append(dict(segment))
+    return segments
+
+
+# 子程序中常駐的轉錄模型（每個子程序各載入一次）
+_worker_backend = None
+
+
+def _init_worker(asr_backend, asr_model, threads):
+    global _worker_backend
+    # 限制每個子程序的運算執行緒，避免多個程序互相搶 CPU
+    for name in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS'):
+        os.environ[name] = str(threads)
+    _worker_backend = get_asr_backend(asr_backend, asr_model, threads)
+
+
+def _transcribe_part(pcm_path, start, end):
+    audio = np.array(np.memmap(pcm_path, dtype=np.float32, mode='r')[start:end])
+    offset = start / SAMPLE_RATE
+    _, segments = _worker_backend.transcribe(audio)
+    return [{'start': segment['start'] + offset,
+             'end': None if segment['end'] is None else segment['end'] + offset,
+             'text': segment['text']}
+            for segment in segments]
+
+
+_process_pools = {}
+_process_pool_lock = threading.Lock()
+
+
+def get_process_pool(processes, asr_backend, asr_model, threads):
+    """取得常駐的轉錄程序池，模型只在子程序啟動時載入一次，之後的影片共用"""
+    key = (processes, asr_backend, asr_model, threads)
+    with _process_pool_lock:
+        if key not in _process_pools:
+            # 主程序中已有其他執行緒，使用 spawn 避免 fork 帶來的鎖死問題
+            _process_pools[key] = ProcessPoolExecutor(
+                max_workers=processes,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+                initargs=(asr_backend, asr_model, threads),
+            )
+        return _process_pools[key]
+
+
+def _transcribe_part_in_process(audio, start, end, asr_backend, asr_model, threads):
+    offset = start / SAMPLE_RATE
+    _, segments = get_asr_backend(asr_backend, asr_model, threads).transcribe(audio[start:end])
+    return [{'start': segment['start'] + offset,
+             'end': None if segment['end'] is None else segment['end'] + offset,
+             'text': segment['text']}
+            for segment in segments]
+
+
+def transcribe_in_parts(audio, parts, processes=1, asr_backend='hf', asr_model='medium', threads=None,
+                        overlap_seconds=1.0, checkpoint=None):
+    """依 split_at_silence 切好的片段 parts 轉錄音訊，返回與單次轉錄相同格式的 (文字, 段落列表)
+
+    processes 大於 1 時以多個程序同時轉錄：音訊先寫成可記憶體映射的暫存 PCM 檔，各程序只讀取自己負責的片段。
+    片段前後各多取 overlap_seconds；合併時略去完全落在相鄰片段重疊區內的段落，
+    橫跨切點、兩邊都轉錄到的句子合併成一段並去除重複的字（見 join_part_segments）。
+    提供 checkpoint（TranscriptionCheckpoint）時，每完成一段就寫入進度檔，已完成的片段不再重新轉錄。
+    """
+    overlap = int(overlap_seconds * SAMPLE_RATE)
+    completed = dict(checkpoint.completed) if checkpoint else {}
+    pending = [(i, max(0, start - overlap), min(len(audio), end + overlap))
+               for i, (start, end) in enumerate(parts) if i not in completed]
+
+    def finish(index, segments):
+        completed[index] = segments
+        if checkpoint:
+            checkpoint.record(index, segments)
+
+    if pending and processes > 1:
+        threads = threads or max(1, (os.cpu_count() or 1) // processes)
+        print(f"分成 {len(parts)} 段（待轉錄 {len(pending)} 段），以 {processes} 個程序（各 {threads} 個執行緒）同時轉錄")
+        with tempfile.NamedTemporaryFile(suffix='.f32', delete=False) as f:
+            pcm_path = f.name
+            f.write(np.ascontiguousarray(audio, dtype=np.float32).tobytes())
+        try:
+            pool = get_process_pool(processes, asr_backend, asr_model, threads)
+            futures = {pool.submit(_transcribe_part, pcm_path, start, end): index for index, start, end in pending}
+            for future in as_completed(futures):
+                finish(futures[future], future.result())
+        finally:
+            os.remove(pcm_path)
+    else:
+        if len(parts) > 1:
+            print(f"分成 {len(parts)} 段（待轉錄 {len(pending)} 段）依序轉錄")
+        for index, start, end in pending:
+            finish(index, _transcribe_part_in_process(audio, start, end, asr_backend, asr_model, threads))
+
+    segments = join_part_segments(
+        [(start / SAMPLE_RATE, end / SAMPLE_RATE, completed[i]) for i, (start, end) in enumerate(parts)])
+    return join_segment_texts(segments), segments
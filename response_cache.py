@@ -0,0 +1,79 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+
+class ResponseCache:
+    """LLM 回覆快取，以 hash(模型, 完整訊息) 為鍵
+
+    相同的模型與訊息（提示詞、逐字稿、聊天內容）直接取用先前的回覆；
+    超過保存天數或總大小上限時，淘汰最久未使用的項目。
+    """
+
+    def __init__(self, db_path='./transcriptions/response_cache.db', max_bytes=100 * 1024 * 1024, max_age_days=30):
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_days * 24 * 3600
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        with self.connection:
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    response TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+            self.connection.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+
+    @staticmethod
+    def make_key(model, messages):
+        payload = json.dumps({'model': model, 'messages': messages}, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, model, messages):
+        key = self.make_key(model, messages)
+        now = time.time()
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.max_age_seconds:
+                self.misses += 1
+                return None
+            with self.connection:
+                self.connection.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0]
+
+    def put(self, model, messages, response):
+        key = self.make_key(model, messages)
+        now = time.time()
+        size = len(response.encode('utf-8'))
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, size, created_at, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, response, size, now, now),
+            )
+            self._evict(now)
+
+    def _evict(self, now):
+        self.connection.execute("DELETE FROM responses WHERE created_at < ?", (now - self.max_age_seconds,))
+        total_size = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total_size <= self.max_bytes:
+            return
+        for key, size in self.connection.execute("SELECT key, size FROM responses ORDER BY last_used").fetchall():
+            self.connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total_size -= size
+            if total_size <= self.max_bytes:
+                break
+
+    def stats_text(self):
+        return f"回應快取：命中 {self.hits} 次，未命中 {self.misses} 次"
@@ -0,0 +1,211 @@
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+
+# 中日韓文字沒有空白分詞，改以相鄰兩字（bigram）作為索引詞；英文與數字以整個單字作為索引詞
+# 索引時另外記錄單字（unigram），只查一個字時才找得到
+INDEX_VERSION = 2  # 索引詞的切法改變時遞增，舊索引會清空後重建
+CJK_RUN_PATTERN = re.compile(r'[\u3400-\u9fff\uf900-\ufaff]+')
+WORD_PATTERN = re.compile(r'[\u3400-\u9fff\uf900-\ufaff]+|[0-9a-z]+')
+
+
+def tokenize(text, cjk_unigrams=False):
+    """將文字切成索引詞，返回 [(索引詞, 在文字中的位置)]
+
+    cjk_unigrams 為 True 時（建立索引），連續的中日韓文字除了相鄰兩字外也記錄每一個字；
+    查詢時只有單獨一個字才以單字查詢，較長的詞仍以相鄰兩字比對。
+    """
+    tokens = []
+    for match in WORD_PATTERN.finditer(text.lower()):
+        word = match.group()
+        if CJK_RUN_PATTERN.fullmatch(word) and len(word) > 1:
+            tokens.extend((word[i:i + 2], match.start() + i) for i in range(len(word) - 1))
+            if cjk_unigrams:
+                tokens.extend((char, match.start() + i) for i, char in enumerate(word))
+        else:
+            tokens.append((word, match.start()))
+    return tokens
+
+
+def parse_transcript_filename(transcript_path):
+    """從 {頻道}_{日期}_{標題}.txt 的檔名取出 (頻道, 標題)"""
+    stem = os.path.splitext(os.path.basename(transcript_path))[0]
+    parts = stem.split('_', 2)
+    if len(parts) == 3:
+        return parts[0], parts[2]
+    return os.path.basename(os.path.dirname(transcript_path)), stem
+
+
+class SearchIndex:
+    """所有逐字稿的全文檢索倒排索引（SQLite）
+
+    每份逐字稿記錄各索引詞的出現次數與第一次出現的位置，查詢時以 BM25 排序，
+    並從第一次出現的位置附近擷取片段。逐字稿寫入時即更新索引，不需要重建整個索引。
+    """
+
+    def __init__(self, db_path='./transcriptions/search_index.db', k1=1.2, b=0.75):
+        self.db_path = db_path
+        self.k1 = k1
+        self.b = b
+        self.synced_dirs = set()
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self.connection = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        with self.connection:
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS documents (
+                    doc_id INTEGER PRIMARY KEY,
+                    path TEXT UNIQUE NOT NULL,
+                    channel_name TEXT,
+                    title TEXT,
+                    length INTEGER NOT NULL,
+                    mtime REAL,
+                    size INTEGER
+                )
+            """)
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS postings (
+                    term TEXT NOT NULL,
+                    doc_id INTEGER NOT NULL,
+                    tf INTEGER NOT NULL,
+                    first_pos INTEGER NOT NULL,
+                    PRIMARY KEY (term, doc_id)
+                ) WITHOUT ROWID
+            """)
+            self.connection.execute("CREATE INDEX IF NOT EXISTS postings_doc ON postings (doc_id)")
+            if self.connection.execute("PRAGMA user_version").fetchone()[0] < INDEX_VERSION:
+                # 舊版索引缺少單字索引詞，清空後由 sync_directory 重新建立
+                self.connection.execute("DELETE FROM postings")
+                self.connection.execute("DELETE FROM documents")
+                self.connection.execute(f"PRAGMA user_version = {INDEX_VERSION}")
+
+    def index_file(self, transcript_path, text=None, channel_name=None, title=None):
+        """加入或更新一份逐字稿（text 未提供時讀取檔案）"""
+        transcript_path = os.path.normpath(transcript_path)
+        if text is None:
+            with open(transcript_path, 'r', encoding='utf-8') as f:
+                text = f.read()
+        if channel_name is None or title is None:
+            channel_name, title = parse_transcript_filename(transcript_path)
+        stat = os.stat(transcript_path)
+
+        tokens = tokenize(text, cjk_unigrams=True)
+        term_counts = Counter(term for term, _ in tokens)
+        first_positions = {}
+        for term, position in tokens:
+            first_positions.setdefault(term, position)
+
+        with self.lock, self.connection:
+            self._remove(transcript_path)
+            cursor = self.connection.execute(
+                "INSERT INTO documents (path, channel_name, title, length, mtime, size) VALUES (?, ?, ?, ?, ?, ?)",
+                (transcript_path, channel_name, title, len(tokens), stat.st_mtime, stat.st_size),
+            )
+            doc_id = cursor.lastrowid
+            self.connection.executemany(
+                "INSERT INTO postings (term, doc_id, tf, first_pos) VALUES (?, ?, ?, ?)",
+                ((term, doc_id, count, first_positions[term]) for term, count in term_counts.items()),
+            )
+
+    def _remove(self, transcript_path):
+        row = self.connection.execute("SELECT doc_id FROM documents WHERE path = ?", (transcript_path,)).fetchone()
+        if row:
+            self.connection.execute("DELETE FROM postings WHERE doc_id = ?", (row[0],))
+            self.connection.execute("DELETE FROM documents WHERE doc_id = ?", (row[0],))
+
+    def sync_directory(self, transcript_dir):
+        """補上目錄中尚未索引或已修改的逐字稿，並移除已不存在的檔案；返回更新的檔案數"""
+        with self.lock:
+            indexed = {path: (mtime, size) for path, mtime, size in
+                       self.connection.execute("SELECT path, mtime, size FROM documents")}
+        updated = 0
+        seen = set()
+        for root, _, files in os.walk(transcript_dir):
+            for name in files:
+                if not name.endswith('.txt'):
+                    continue
+                path = os.path.normpath(os.path.join(root, name))
+                seen.add(path)
+                stat = os.stat(path)
+                if indexed.get(path) != (stat.st_mtime, stat.st_size):
+                    self.index_file(path)
+                    updated += 1
+        prefix = os.path.normpath(transcript_dir) + os.sep
+        with self.lock, self.connection:
+            for path in indexed:
+                if path.startswith(prefix) and path not in seen:
+                    self._remove(path)
+        self.synced_dirs.add(transcript_dir)
+        return updated
+
+    def search(self, query, limit=10, snippet_chars=80):
+        """以 BM25 排序查詢結果，返回 [{'path', 'channel_name', 'title', 'score', 'snippet'}]"""
+        terms = set(term for term, _ in tokenize(query))
+        if not terms:
+            return []
+
+        with self.lock:
+            doc_count, average_length = self.connection.execute(
+                "SELECT COUNT(*), AVG(length) FROM documents").fetchone()
+            if not doc_count:
+                return []
+            scores = Counter()
+            positions = {}
+            for term in terms:
+                postings = self.connection.execute(
+                    "SELECT p.doc_id, p.tf, p.first_pos, d.length FROM postings p JOIN documents d ON d.doc_id = p.doc_id"
+                    " WHERE p.term = ?", (term,)).fetchall()
+                if not postings:
+                    continue
+                idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf, first_pos, length in postings:
+                    norm = self.k1 * (1 - self.b + self.b * length / (average_length or 1))
+                    scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+                    # 片段優先取自最少見（idf 最高）的查詢詞
+                    if doc_id not in positions or idf > positions[doc_id][0]:
+                        positions[doc_id] = (idf, first_pos)
+
+            results = []
+            for doc_id, score in scores.most_common(limit):
+                path, channel_name, title = self.connection.execute(
+                    "SELECT path, channel_name, title FROM documents WHERE doc_id = ?", (doc_id,)).fetchone()
+                results.append({'path': path, 'channel_name': channel_name, 'title': title, 'score': score,
+                                'position': positions[doc_id][1]})
+
+        for result in results:
+            result['snippet'] = self._snippet(result.pop('position'), result['path'], query, snippet_chars)
+        return results
+
+    @staticmethod
+    def _snippet(position, transcript_path, query, snippet_chars):
+        try:
+            with open(transcript_path, 'r', encoding='utf-8') as f:
+                text = f.read()
+        except OSError:
+            return ""
+        exact = text.lower().find(query.strip().lower())
+        if exact >= 0:
+            position = exact
+        start = max(0, position - snippet_chars // 3)
+        snippet = ' '.join(text[start:start + snippet_chars].split())
+        return ('…' if start > 0 else '') + snippet + ('…' if start + snippet_chars < len(text) else '')
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+_search_indexes = {}
+_search_index_lock = threading.Lock()
+
+
+def get_search_index(db_path='./transcriptions/search_index.db'):
+    """取得共用的索引（同一個資料庫只開啟一次）"""
+    with _search_index_lock:
+        if db_path not in _search_indexes:
+            _search_indexes[db_path] = SearchIndex(db_path)
+        return _search_indexes[db_path]
@@ -0,0 +1,89 @@
+import json
+import mmap
+import os
+import struct
+
+# 索引檔每筆記錄：段落開始秒數（float64）與該段在 .segments.jsonl 中的位元組位置（uint64）
+INDEX_RECORD = struct.Struct('<dQ')
+
+
+def segments_path(transcript_path):
+    return os.path.splitext(transcript_path)[0] + '.segments.jsonl'
+
+
+def segment_index_path(transcript_path):
+    return os.path.splitext(transcript_path)[0] + '.segments.idx'
+
+
+def write_segments(transcript_path, segments):
+    """將 [{'start', 'end', 'text'}] 寫到逐字稿旁的 .segments.jsonl，並建立依時間排序的位置索引"""
+    segments = sorted(segments, key=lambda segment: segment['start'])
+    offsets = []
+    with open(segments_path(transcript_path), 'wb') as f:
+        for segment in segments:
+            offsets.append((segment['start'], f.tell()))
+            record = {'start': round(segment['start'], 3),
+                      'end': None if segment.get('end') is None else round(segment['end'], 3),
+                      'text': segment['text']}
+            f.write((json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8'))
+    with open(segment_index_path(transcript_path), 'wb') as f:
+        for start, offset in offsets:
+            f.write(INDEX_RECORD.pack(start, offset))
+
+
+class SegmentReader:
+    """依時間讀取逐字稿段落
+
+    以二分搜尋在索引檔中找到時間範圍的起點，再從 .segments.jsonl 的對應位置往後讀，
+    不需要解析整個檔案。
+    """
+
+    def __init__(self, transcript_path):
+        self.index_file = open(segment_index_path(transcript_path), 'rb')
+        self.segments_file = open(segments_path(transcript_path), 'rb')
+        size = os.fstat(self.index_file.fileno()).st_size
+        self.index = mmap.mmap(self.index_file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        self.count = size // INDEX_RECORD.size
+
+    @staticmethod
+    def exists(transcript_path):
+        return os.path.exists(segment_index_path(transcript_path)) and os.path.exists(segments_path(transcript_path))
+
+    def __len__(self):
+        return self.count
+
+    def _record(self, i):
+        return INDEX_RECORD.unpack_from(self.index, i * INDEX_RECORD.size)
+
+    def _first_at_or_after(self, seconds):
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._record(middle)[0] < seconds:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def read_range(self, start, end=None):
+        """返回與 [start, end) 秒重疊的段落；end 為 None 時讀到結尾"""
+        if not self.count:
+            return []
+        # 開始時間早於 start 的前一段仍可能延續到範圍內
+        i = max(0, self._first_at_or_after(start) - 1)
+        self.segments_file.seek(self._record(i)[1])
+        segments = []
+        for line in self.segments_file:
+            segment = json.loads(line)
+            if end is not None and segment['start'] >= end:
+                break
+            if segment['end'] is None or segment['end'] > start:
+                segments.append(segment)
+        return segments
+
+    def close(self):
+        if self.index is not None:
+            self.index.close()
+        self.index_file.close()
+        self.segments_file.close()
+
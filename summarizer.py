@@ -0,0 +1,146 @@
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+SUMMARY_PROMPT = "你是一個專業的逐字稿摘要生成器。當你收到逐字稿時，請產生一份詳盡且專業的摘要。摘要應專注於總結主持人關於企業、股市、產業及經濟面的看法和觀點。最重要的是摘要必須包括逐字稿中提到的每一間企業，條列式列出整理整理主持人對這些企業的近期看法和相關消息，每個觀點都要包含在摘要內。若逐字稿中有廣告、業配或與上述主題無關的閒聊內容，請忽略。僅需列出摘要內容，不需要包含任何額外的對話或說明。使用繁體中文回復。回答時使用html格式做回覆，不要有任何多餘的符號，不要隨意加粗或放大字體。"
+
+CHUNK_PROMPT = "你是一個專業的逐字稿重點整理助手。你會收到一段較長逐字稿中的其中一部分，請以繁體中文條列整理這一段中主持人關於企業、股市、產業及經濟面的看法和觀點。必須列出這一段提到的每一間企業，以及主持人對該企業的看法和相關消息，不可遺漏。忽略廣告、業配及無關的閒聊。只輸出條列重點，不要有任何額外的說明。"
+
+MERGE_PROMPT = "你會收到同一份逐字稿依序分段整理出的重點。請將它們合併成一份完整的摘要：去除重複的內容，但每一間被提到的企業以及對應的觀點都必須保留，不可遺漏。"
+
+# 各模型的上下文長度與每分鐘 token 上限（Groq 免費方案、OpenAI 第一級）；
+# Groq 會把輸入加上輸出計入每分鐘上限，超過時整個請求直接被拒絕，所以單次請求要同時低於兩者
+MODEL_LIMITS = {
+    'llama-3.1-70b-versatile': {'context_tokens': 131072, 'tokens_per_minute': 20000},
+    'llama-3.1-8b-instant': {'context_tokens': 131072, 'tokens_per_minute': 20000},
+    'gpt-4o-mini': {'context_tokens': 128000, 'tokens_per_minute': 200000},
+}
+DEFAULT_CHUNK_TOKENS = 6000  # 不認得的模型（例如經由 --base_url 使用的其他服務）沿用保守的預算
+OUTPUT_RESERVE_TOKENS = 4096  # 保留給摘要輸出的 token 數
+
+CJK_PATTERN = re.compile(r'[\u3000-\u9fff\uac00-\ud7af\uff00-\uffef]')
+SENTENCE_END_PATTERN = re.compile(r'(?<=[。！？!?；;\n])')
+
+
+def estimate_tokens(text):
+    """粗估文字的 token 數：中日韓字元約一字一個 token，其他文字約四個字元一個 token"""
+    cjk_count = len(CJK_PATTERN.findall(text))
+    return cjk_count + (len(text) - cjk_count) // 4 + 1
+
+
+def token_budget(model):
+    """單次請求可放入的逐字稿 token 數：上下文長度與每分鐘上限取較小者，再扣除提示詞與輸出保留的空間"""
+    limits = MODEL_LIMITS.get(model)
+    if limits is None:
+        return DEFAULT_CHUNK_TOKENS
+    limit = min(limits['context_tokens'], limits['tokens_per_minute'])
+    return limit - OUTPUT_RESERVE_TOKENS - estimate_tokens(SUMMARY_PROMPT + MERGE_PROMPT)
+
+
+def split_by_token_budget(text, token_budget):
+    """依 token 預算切分文字，盡量在句尾切開"""
+    pieces = []
+    current = []
+    current_tokens = 0
+    for sentence in SENTENCE_END_PATTERN.split(text):
+        sentence_tokens = estimate_tokens(sentence)
+        # 單句超過預算時按字元硬切
+        while sentence_tokens > token_budget:
+            cut = max(1, len(sentence) * token_budget // sentence_tokens)
+            if current:
+                pieces.append(''.join(current))
+                current, current_tokens = [], 0
+            pieces.append(sentence[:cut])
+            sentence = sentence[cut:]
+            sentence_tokens = estimate_tokens(sentence)
+        if current and current_tokens + sentence_tokens > token_budget:
+            pieces.append(''.join(current))
+            current, current_tokens = [], 0
+        current.append(sentence)
+        current_tokens += sentence_tokens
+    if current and ''.join(current).strip():
+        pieces.append(''.join(current))
+    return pieces
+
+
+class MapReduceSummarizer:
+    """超過模型上下文的逐字稿改用分段摘要再合併
+
+    單次請求放得下（依模型的 token 預算）時維持一次摘要；否則依預算切段後以有限的並行數同時摘要，再把各段重點合併成最終摘要；
+    各段結果經由回應快取保存，逐字稿只有部分改變時只需重新計算改變的段落。
+    """
+
+    def __init__(self, complete, stream_complete, model, cache=None, chunk_tokens=None, max_concurrency=4):
+        self.complete = complete  # complete(messages) -> 完整回覆
+        self.stream_complete = stream_complete  # stream_complete(messages) -> 逐段產生文字
+        self.model = model
+        self.cache = cache
+        self.chunk_tokens = chunk_tokens or token_budget(model)
+        self.max_concurrency = max_concurrency
+
+    def summarize(self, transcript, on_chunk=None, use_cache=True):
+        if estimate_tokens(transcript) <= self.chunk_tokens:
+            # 逐字稿不長時維持單次請求
+            messages = [{"role": "system", "content": SUMMARY_PROMPT}, {"role": "user", "content": "逐字稿: " + transcript}]
+            return self._stream(messages, on_chunk)
+
+        pieces = split_by_token_budget(transcript, self.chunk_tokens)
+        print(f"逐字稿過長，分成 {len(pieces)} 段摘要後合併")
+        # 每段的請求只含該段文字（不含段落編號），段數改變時未改動的段落仍能命中快取；順序由合併步驟標示
+        notes = self._map(
+            [[{"role": "system", "content": CHUNK_PROMPT}, {"role": "user", "content": "逐字稿片段: " + piece}]
+             for piece in pieces],
+            use_cache,
+        )
+
+        # 合併後仍超過預算時，先分組合併，直到可以一次送出
+        while len(notes) > 1 and estimate_tokens('\n\n'.join(notes)) > self.chunk_tokens:
+            groups = self._group_by_budget(notes)
+            if len(groups) == len(notes):
+                break  # 每段重點本身就接近預算，無法再分組
+            notes = self._map(
+                [[{"role": "system", "content": MERGE_PROMPT + "只輸出條列重點，不要有任何額外的說明。"},
+                  {"role": "user", "content": '\n\n'.join(group)}]
+                 for group in groups],
+                use_cache,
+            )
+
+        messages = [
+            {"role": "system", "content": SUMMARY_PROMPT + MERGE_PROMPT},
+            {"role": "user", "content": "各段重點:\n\n" + '\n\n'.join(
+                f"第 {i + 1} 段:\n{note}" for i, note in enumerate(notes))},
+        ]
+        return self._stream(messages, on_chunk)
+
+    def _map(self, message_lists, use_cache):
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            return list(executor.map(lambda messages: self._cached_complete(messages, use_cache), message_lists))
+
+    def _cached_complete(self, messages, use_cache):
+        if self.cache and use_cache:
+            cached_response = self.cache.get(self.model, messages)
+            if cached_response is not None:
+                return cached_response
+        response = self.complete(messages)
+        if self.cache:
+            self.cache.put(self.model, messages, response)
+        return response
+
+    def _stream(self, messages, on_chunk):
+        chunks = []
+        for chunk in self.stream_complete(messages):
+            chunks.append(chunk)
+            if on_chunk:
+                on_chunk(chunk)
+        return ''.join(chunks).strip()
+
+    def _group_by_budget(self, notes):
+        groups = [[]]
+        group_tokens = 0
+        for note in notes:
+            note_tokens = estimate_tokens(note)
+            if groups[-1] and group_tokens + note_tokens > self.chunk_tokens:
+                groups.append([])
+                group_tokens = 0
+            groups[-1].append(note)
+            group_tokens += note_tokens
+        return groups
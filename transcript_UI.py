@@ -1,50 +1,81 @@
+import os
 import sys
-import json
-from PyQt5.QtWidgets import QApplication, QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLabel, QTextEdit, QTabWidget, QGroupBox, QComboBox, QLineEdit, QGraphicsDropShadowEffect
+from PyQt5.QtWidgets import QApplication, QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLabel, QTextEdit, QTabWidget, QComboBox, QLineEdit, QTreeView, QCheckBox, QListWidget, QListWidgetItem
 from PyQt5.QtCore import Qt, QTimer, pyqtSignal, QThread
-from PyQt5.QtGui import QIcon, QColor
-from utils import (initialize_openai_client, initialize_groq_client, get_openai_response, 
-                   get_groq_response, load_json_data, save_json_data, load_transcript, SummaryWorker)
+from PyQt5.QtGui import QIcon, QTextCursor
+from utils import (initialize_openai_client, initialize_groq_client, transcript_cache, TranscriptPager,
+                   TranscriptLoader, FullTextSearchWorker, LLMRequestManager)
 from youtube_video_processor import process_single_video
+from metadata_store import open_metadata_store
+from video_library_model import VideoLibraryModel, VideoFilterProxyModel
+from transcript_retriever import TranscriptRetriever, get_retriever
+from response_cache import ResponseCache
+from chat_context import ChatContext
+from chat_session_store import ChatSessionStore
+from search_index import get_search_index
 
 groq_api_key = "Your groq api key"
 openai_api_key = "Your openai api key"
 
+CHAT_SYSTEM_PROMPT = "你是一個聊天助手，請根據以下逐字稿內容回答用戶的問題。回答時使用html格式做回覆，不要有任何多餘的符號，不要隨意加粗或放大字體。"
+
 
 class DownloadThread(QThread):
     download_finished = pyqtSignal(str)  # 定義一個信號，會發送一個字符串
 
-    def __init__(self, url, output_dir, json_path):
+    def __init__(self, url, output_dir, metadata_path):
         super().__init__()
         self.url = url
         self.output_dir = output_dir
-        self.json_path = json_path
+        self.metadata_path = metadata_path
 
     def run(self):
         """在這裡執行下載操作"""
         try:
             # 假設 process_single_video 是用於下載的函數
-            process_single_video(self.url, output_dir=self.output_dir, json_path=self.json_path)
+            process_single_video(self.url, output_dir=self.output_dir, metadata_path=self.metadata_path)
             self.download_finished.emit("逐字稿和摘要已成功下載並顯示！")  # 發送信號，並傳遞字符串參數
         except Exception as e:
             self.download_finished.emit(f"下載過程中出現錯誤：{str(e)}")  # 發送錯誤消息
 
 class VideoTranscriptsApp(QWidget):
-    def __init__(self, data, file_path):
+    def __init__(self, data, metadata_store):
         super().__init__()
         self.data = data
-        self.file_path = file_path
+        self.metadata_store = metadata_store
         self.current_transcript = ""
+        self.current_transcript_path = None
+        self.transcript_pager = None
+        self.transcript_page = 0
+        self.transcript_loaders = []  # 執行中的逐字稿讀取執行緒（保留參考直到結束）
         self.current_summary = ""
-        self.current_chat_history = []  # 用於儲存聊天歷史
-        self.chat_histories = {}  # 用於儲存每個逐字稿的聊天歷史
-        self.current_button = None
+        self.current_chat_history = ChatContext()  # 用於儲存聊天歷史（較早的對話會折疊成摘要後再送出）
+        self.chat_histories = {}  # 已載入的各逐字稿聊天歷史
+        self.chat_session_store = ChatSessionStore()  # 聊天歷史逐則寫入磁碟，重新開啟程式後仍保留
+        # 逐字稿檢索：有安裝向量模型套件時，聊天只送出與問題相關的段落
+        self.retriever = get_retriever() if TranscriptRetriever.is_available() else None
+        self.transcript_titles = {video_info['transcript_path']: video_title
+                                  for videos in data.values() for video_title, video_info in videos.items()}
+        if self.retriever is not None:
+            # 尚未建立索引的逐字稿在背景補上，跨集數提問時不需等待
+            self.retriever.schedule_missing(list(self.transcript_titles))
+        # 全文檢索：結果以正規化後的逐字稿路徑對應回影片
+        self.search_index = get_search_index('./transcriptions/search_index.db')
+        self.search_workers = []
+        self.videos_by_path = {os.path.normpath(video_info['transcript_path']): video_info
+                               for videos in data.values() for video_info in videos.values()}
+        self.response_cache = ResponseCache()
         self.current_video_info = None
-        self.summary_worker = None
-        self.chat_worker = None  # 用來處理聊天回應的 worker thread
+        # 摘要與聊天請求交給工作池處理，結果依請求編號送回發出請求的影片
+        self.request_manager = LLMRequestManager(cache=self.response_cache)
+        self.request_manager.cache_checked.connect(self.on_request_cache_checked)
+        self.request_manager.chunk_generated.connect(self.on_request_chunk)
+        self.request_manager.response_generated.connect(self.on_request_response)
+        self.request_manager.request_failed.connect(self.on_request_failed)
+        self.summary_request_id = None  # 目前影片的摘要請求
+        self.chat_requests = {}  # 請求編號 -> {'transcript_path', 'history', 'text', 'cursor'}
         self.loading_timer = None
-        self.use_openai = False
-        self.transcript_sent = False
+        self.streaming_summary = ""
         self.model = "llama-3.1-70b-versatile"
         self.api_client = initialize_groq_client(groq_api_key)
         self.initUI()
@@ -123,44 +154,44 @@ class VideoTranscriptsApp(QWidget):
         # 將 URL 輸入框和下載按鈕的布局添加到 sidebar_layout 的頂部
         sidebar_layout.addLayout(url_layout)
 
-        for category, videos in self.data.items():
-            group_box = QGroupBox(f"{category}", self)
-            group_layout = QVBoxLayout()
-
-            group_box.setStyleSheet("background-color: transparent;")
-
-            for video_title, video_info in videos.items():
-                button = QPushButton(video_title, self)
-                button.setCheckable(True)
-                button.setStyleSheet("""
-                    QPushButton {
-                        padding: 12px;
-                        font-size: 15px;
-                        background-color: #ffffff;
-                        color: #333333;
-                        border-radius: 5px;
-                    }
-                    QPushButton:checked {
-                        background-color: #56CCF2;
-                        border: 2px solid #2D9CDB;
-                        color: #ffffff;
-                    }
-                    QPushButton:hover {
-                        background-color: #E6F7FF;
-                    }
-                """)
-                
-                button_shadow = QGraphicsDropShadowEffect()
-                button_shadow.setBlurRadius(15)
-                button_shadow.setOffset(0, 0)
-                button_shadow.setColor(QColor(0, 0, 0, 80))
-                button.setGraphicsEffect(button_shadow)
-
-                button.clicked.connect(lambda checked, info=video_info, btn=button: self.load_transcript_and_summary(info, btn))
-                group_layout.addWidget(button)
-
-            group_box.setLayout(group_layout)
-            sidebar_layout.addWidget(group_box)
+        # 搜尋框：輸入時即時過濾影片標題或頻道名稱
+        self.search_input = QLineEdit()
+        self.search_input.setPlaceholderText("搜尋影片...")
+        self.search_input.setStyleSheet("padding: 8px;")
+        sidebar_layout.addWidget(self.search_input)
+
+        # 影片列表使用模型/視圖，只繪製可見的項目
+        self.library_model = VideoLibraryModel(self.data, self)
+        self.library_proxy = VideoFilterProxyModel(self)
+        self.library_proxy.setSourceModel(self.library_model)
+        self.search_input.textChanged.connect(self.filter_videos)
+
+        self.video_tree = QTreeView(self)
+        self.video_tree.setModel(self.library_proxy)
+        self.video_tree.setHeaderHidden(True)
+        self.video_tree.setUniformRowHeights(True)
+        self.video_tree.setMinimumWidth(320)
+        self.video_tree.setStyleSheet("""
+            QTreeView {
+                font-size: 15px;
+                background-color: #ffffff;
+                color: #333333;
+                border: 1px solid #ddd;
+                border-radius: 4px;
+            }
+            QTreeView::item {
+                padding: 8px;
+            }
+            QTreeView::item:hover {
+                background-color: #E6F7FF;
+            }
+            QTreeView::item:selected {
+                background-color: #56CCF2;
+                color: #ffffff;
+            }
+        """)
+        self.video_tree.clicked.connect(self.on_video_selected)
+        sidebar_layout.addWidget(self.video_tree)
 
         main_layout.addLayout(sidebar_layout)
 
@@ -188,6 +219,26 @@ class VideoTranscriptsApp(QWidget):
 
         self.transcript_display = QTextEdit(self)
         self.transcript_display.setReadOnly(True)
+
+        # 逐字稿分頁瀏覽
+        self.prev_page_button = QPushButton("上一頁", self)
+        self.prev_page_button.clicked.connect(lambda: self.show_transcript_page(self.transcript_page - 1))
+        self.next_page_button = QPushButton("下一頁", self)
+        self.next_page_button.clicked.connect(lambda: self.show_transcript_page(self.transcript_page + 1))
+        self.page_label = QLabel("", self)
+        self.page_label.setAlignment(Qt.AlignCenter)
+
+        page_layout = QHBoxLayout()
+        page_layout.addWidget(self.prev_page_button)
+        page_layout.addWidget(self.page_label)
+        page_layout.addWidget(self.next_page_button)
+
+        transcript_layout = QVBoxLayout()
+        transcript_layout.addWidget(self.transcript_display)
+        transcript_layout.addLayout(page_layout)
+
+        self.transcript_widget = QWidget()
+        self.transcript_widget.setLayout(transcript_layout)
         self.summary_display = QTextEdit(self)
         self.summary_display.setReadOnly(True)
 
@@ -201,12 +252,34 @@ class VideoTranscriptsApp(QWidget):
         chat_layout.addWidget(self.chat_display)
         chat_layout.addWidget(self.chat_input)
 
+        self.search_all_checkbox = QCheckBox("跨所有集數提問", self)
+        if self.retriever is None:
+            self.search_all_checkbox.setEnabled(False)
+            self.search_all_checkbox.setToolTip("需要安裝 sentence-transformers 才能跨集數檢索")
+        chat_layout.addWidget(self.search_all_checkbox)
+
         chat_widget = QWidget()
         chat_widget.setLayout(chat_layout)
 
+        # 全文搜尋：在所有逐字稿中搜尋關鍵字，點擊結果切換到該集
+        self.fulltext_input = QLineEdit(self)
+        self.fulltext_input.setPlaceholderText("搜尋所有逐字稿內容（例如公司名稱）...")
+        self.fulltext_input.returnPressed.connect(self.search_transcripts)
+        self.search_results = QListWidget(self)
+        self.search_results.setWordWrap(True)
+        self.search_results.itemClicked.connect(self.on_search_result_selected)
+
+        search_layout = QVBoxLayout()
+        search_layout.addWidget(self.fulltext_input)
+        search_layout.addWidget(self.search_results)
+
+        search_widget = QWidget()
+        search_widget.setLayout(search_layout)
+
         self.tab_widget.addTab(self.summary_display, "Summary")
         self.tab_widget.addTab(chat_widget, "Chat")
-        self.tab_widget.addTab(self.transcript_display, "Transcript")
+        self.tab_widget.addTab(self.transcript_widget, "Transcript")
+        self.tab_widget.addTab(search_widget, "Search")
         self.tab_widget.addTab(self.system_message_display, "System Messages")
 
         self.tab_widget.currentChanged.connect(self.update_buttons_visibility)
@@ -243,7 +316,7 @@ class VideoTranscriptsApp(QWidget):
         self.tab_widget.setCurrentIndex(self.tab_widget.indexOf(self.system_message_display))  # 切換到系統訊息頁面
 
         # 創建和啟動下載執行緒
-        self.download_thread = DownloadThread(url, './transcriptions', './transcriptions/metadata.json')
+        self.download_thread = DownloadThread(url, './transcriptions', self.metadata_store.db_path)
         self.download_thread.download_finished.connect(self.on_download_finished)  # 連接信號和槽
         self.download_thread.start()
 
@@ -268,64 +341,84 @@ class VideoTranscriptsApp(QWidget):
     def change_api(self, index):
         """切換使用的API"""
         if index == 0:
-            self.use_openai = False
             self.model = "llama-3.1-70b-versatile"
             self.api_client = initialize_groq_client(groq_api_key)
         elif index == 1:
-            self.use_openai = False
             self.model = "llama-3.1-8b-instant"
             self.api_client = initialize_groq_client(groq_api_key)
         else:
-            self.use_openai = True
             self.model = "gpt-4o-mini"
             self.api_client = initialize_openai_client(openai_api_key)
 
-    def load_transcript_and_summary(self, video_info, button):
+    def filter_videos(self, text):
+        """依搜尋文字過濾影片列表"""
+        self.library_proxy.set_filter_text(text.strip())
+        if text.strip():
+            self.video_tree.expandAll()
+
+    def search_transcripts(self):
+        """在背景執行全文搜尋"""
+        query = self.fulltext_input.text().strip()
+        if not query:
+            return
+        worker = FullTextSearchWorker(self.search_index, query, './transcriptions')
+        worker.results_ready.connect(self.show_search_results)
+        worker.finished.connect(lambda worker=worker: self.search_workers.remove(worker))
+        self.search_workers.append(worker)
+        worker.start()
+
+    def show_search_results(self, query, results):
+        """顯示搜尋結果；較早送出的查詢晚到時忽略"""
+        if query != self.fulltext_input.text().strip():
+            return
+        self.search_results.clear()
+        if not results:
+            self.search_results.addItem("找不到相關的逐字稿")
+            return
+        for result in results:
+            item = QListWidgetItem(f"{result['channel_name']} / {result['title']}\n{result['snippet']}")
+            item.setData(Qt.UserRole, result['path'])
+            self.search_results.addItem(item)
+
+    def on_search_result_selected(self, item):
+        """點擊搜尋結果時切換到該集的逐字稿"""
+        video_info = self.videos_by_path.get(item.data(Qt.UserRole))
+        if video_info is None:
+            return
+        self.load_transcript_and_summary(video_info)
+        self.tab_widget.setCurrentIndex(self.tab_widget.indexOf(self.transcript_widget))
+
+    def on_video_selected(self, index):
+        """點擊影片列表項目；點擊頻道時展開或收合"""
+        video_info = index.data(VideoLibraryModel.VideoInfoRole)
+        if video_info is None:
+            self.video_tree.setExpanded(index, not self.video_tree.isExpanded(index))
+            return
+        self.load_transcript_and_summary(video_info)
+
+    def load_transcript_and_summary(self, video_info):
         """切換逐字稿時的處理"""
-        # 如果點擊的標題與當前選中的標題相同，則不執行任何操作
-        if self.current_button == button and button.isChecked():
+        # 如果點擊的影片與當前選中的影片相同，則不執行任何操作
+        if video_info is self.current_video_info:
             return
 
-        # 保存當前逐字稿的聊天歷史
-        if self.current_video_info:
-            self.chat_histories[self.current_video_info['transcript_path']] = self.current_chat_history
-
-        # 重置之前選中的按鈕狀態
-        if self.current_button and self.current_button != button:
-            self.current_button.setChecked(False)
-            self.current_button.setStyleSheet("""
-                QPushButton {
-                    padding: 12px;
-                    font-size: 15px;
-                    background-color: #ffffff;
-                    color: #333333;
-                    border-radius: 5px;
-                }
-                QPushButton:checked {
-                    background-color: #56CCF2;
-                    border: 2px solid #2D9CDB;
-                    color: #ffffff;
-                }
-                QPushButton:hover {
-                    background-color: #E6F7FF;
-                }
-            """)
-
-        # 設置當前選中的按鈕
-        self.current_button = button
-        self.current_button.setChecked(True)
+        # 前一部影片的摘要不再需要，取消請求（同時中斷連線）；聊天回應仍會寫回原影片的聊天歷史
+        self.cancel_summary_request()
+        self.stop_loading_animation()
+        for request in self.chat_requests.values():
+            request['cursor'] = None  # 聊天視窗會清空重繪，回到該影片後再重新顯示串流內容
         self.current_video_info = video_info
 
         transcript_path = video_info['transcript_path']
-        self.current_transcript = load_transcript(transcript_path)
-        self.transcript_display.setText(self.current_transcript)
+        self.open_transcript_pager(transcript_path)
 
-        # 加載之前的聊天歷史，或者設置為空
-        self.current_chat_history = self.chat_histories.get(transcript_path, [])
-        self.transcript_sent = False  # 重置，因為是新逐字稿
+        # 加載之前的聊天歷史（第一次選到這部影片時才從磁碟讀取）
+        if transcript_path not in self.chat_histories:
+            self.chat_histories[transcript_path] = self.chat_session_store.load(transcript_path)
+        self.current_chat_history = self.chat_histories[transcript_path]
 
         self.chat_display.clear()  # 清空聊天顯示
-        for message in self.current_chat_history:
+        for message in self.current_chat_history.turns:
             role = "User" if message["role"] == "user" else "Assistant"
             self.chat_display.append(f"{role}: {message['content']}")
 
@@ -338,20 +431,103 @@ class VideoTranscriptsApp(QWidget):
         else:
             self.start_loading_animation()  # 開始動態顯示 "生成中..."
             self.save_button.setEnabled(False)
-            self.regenerate_button.setEnabled(True)
+            self.regenerate_button.setEnabled(False)  # 完整逐字稿載入後才能生成
 
-            # 終止之前的摘要生成 worker thread
-            if self.summary_worker and self.summary_worker.isRunning():
-                self.summary_worker.terminate()
-
-            # 開始生成摘要（使用 Worker thread）
-            self.summary_worker = SummaryWorker(self.current_transcript, self.use_openai, self.model, self.api_client, "summary")
-            self.summary_worker.summary_generated.connect(self.display_summary)
-            self.summary_worker.start()
+        # 完整逐字稿（供摘要及聊天使用）在背景讀取，最近看過的逐字稿直接取自快取
+        self.current_transcript = ""
+        self.current_transcript_path = transcript_path
+        cached_transcript = transcript_cache.peek(transcript_path)
+        if cached_transcript is not None:
+            self.on_transcript_loaded(transcript_path, cached_transcript)
+        else:
+            loader = TranscriptLoader(transcript_path)
+            loader.transcript_loaded.connect(self.on_transcript_loaded)
+            loader.finished.connect(lambda loader=loader: self.transcript_loaders.remove(loader))
+            self.transcript_loaders.append(loader)
+            loader.start()
+
+    def on_transcript_loaded(self, transcript_path, transcript):
+        """完整逐字稿讀取完成；若使用者已切換到其他影片則忽略"""
+        if transcript_path != self.current_transcript_path:
+            return
+        self.current_transcript = transcript
+        self.regenerate_button.setEnabled(True)
+
+        if 'summary' not in self.current_video_info:
+            self.start_summary_request()
+
+    def start_summary_request(self, use_cache=True):
+        """開始生成摘要（交給工作池），摘要以串流方式逐段顯示"""
+        self.cancel_summary_request()
+        self.start_loading_animation()  # 串流內容送達前顯示 "生成中..."，不留下前一部影片的摘要
+        self.streaming_summary = ""
+        self.summary_request_id = self.request_manager.submit_summary(
+            self.current_transcript, self.api_client, self.model, use_cache=use_cache)
+
+    def cancel_summary_request(self):
+        """取消進行中的摘要請求"""
+        if self.summary_request_id is not None:
+            self.request_manager.cancel(self.summary_request_id)
+            self.summary_request_id = None
+
+    def is_current_chat(self, request):
+        return self.current_video_info is not None and request['transcript_path'] == self.current_video_info['transcript_path']
+
+    def on_request_cache_checked(self, request_id, hit):
+        if request_id == self.summary_request_id or request_id in self.chat_requests:
+            self.show_cache_stats(hit)
+
+    def on_request_chunk(self, request_id, chunk):
+        """串流中的文字只顯示在發出請求的影片上"""
+        if request_id == self.summary_request_id:
+            self.display_summary_chunk(chunk)
+        elif request_id in self.chat_requests:
+            request = self.chat_requests[request_id]
+            request['text'] += chunk
+            if self.is_current_chat(request):
+                self.render_streaming_chat(request, request['text'])
+
+    def on_request_response(self, request_id, response):
+        if request_id == self.summary_request_id:
+            self.summary_request_id = None
+            self.display_summary(response)
+        elif request_id in self.chat_requests:
+            self.display_chat_response(self.chat_requests.pop(request_id), response)
+
+    def on_request_failed(self, request_id, message):
+        if request_id == self.summary_request_id:
+            self.summary_request_id = None
+            self.stop_loading_animation()
+            self.summary_display.setText("摘要生成失敗，請稍後重新生成。")
+        elif request_id in self.chat_requests:
+            self.chat_requests.pop(request_id)
+        else:
+            return
+        self.system_message_display.append(f"請求失敗：{message}")
+
+    def open_transcript_pager(self, transcript_path):
+        """以分頁方式開啟逐字稿並顯示第一頁"""
+        if self.transcript_pager:
+            self.transcript_pager.close()
+        self.transcript_pager = TranscriptPager(transcript_path)
+        self.show_transcript_page(0)
+
+    def show_transcript_page(self, page):
+        """顯示逐字稿的指定頁面"""
+        if not self.transcript_pager:
+            return
+        page = max(0, min(page, self.transcript_pager.page_count - 1))
+        self.transcript_page = page
+        self.transcript_display.setPlainText(self.transcript_pager.read_page(page))
+        self.page_label.setText(f"第 {page + 1} / {self.transcript_pager.page_count} 頁")
+        self.prev_page_button.setEnabled(page > 0)
+        self.next_page_button.setEnabled(page < self.transcript_pager.page_count - 1)
 
     def start_loading_animation(self):
         """啟動'生成中...'的動態效果"""
+        self.stop_loading_animation()
         self.loading_text = "生成中"
+        self.summary_display.setText(self.loading_text)
         self.loading_timer = QTimer(self)
         self.loading_timer.timeout.connect(self.update_loading_text)
         self.loading_timer.start(500)
@@ -369,6 +545,16 @@ class VideoTranscriptsApp(QWidget):
             self.loading_timer.stop()
             self.loading_timer = None
 
+    def show_cache_stats(self, hit):
+        """在系統訊息中顯示回應快取的命中統計"""
+        self.system_message_display.append(f"{self.response_cache.stats_text()}（本次{'命中' if hit else '未命中'}）")
+
+    def display_summary_chunk(self, chunk):
+        """收到第一段文字時停止'生成中...'，之後逐段更新摘要"""
+        self.stop_loading_animation()
+        self.streaming_summary += chunk
+        self.summary_display.setText(self.streaming_summary)
+
     def display_summary(self, summary):
         """顯示摘要內容"""
         self.stop_loading_animation()
@@ -377,35 +563,29 @@ class VideoTranscriptsApp(QWidget):
         self.save_button.setEnabled(True)
 
     def save_summary(self):
-        """保存摘要到metadata.json"""
-        for category, videos in self.data.items():
-            for video_title, video_info in videos.items():
-                if video_info == self.current_video_info:
-                    self.data[category][video_title]['summary'] = self.current_summary
-                    save_json_data(self.file_path, self.data)
-                    return
+        """保存摘要到元數據資料庫（只更新目前這部影片）"""
+        if self.current_video_info:
+            self.current_video_info['summary'] = self.current_summary
+            self.metadata_store.set_summary(self.current_video_info['video_id'], self.current_summary)
 
     def regenerate_summary(self):
         """重新生成摘要"""
         if self.current_transcript:
-            self.start_loading_animation()
             self.save_button.setEnabled(False)
 
-            if self.summary_worker and self.summary_worker.isRunning():
-                self.summary_worker.terminate()
-
-            self.summary_worker = SummaryWorker(self.current_transcript, self.use_openai, self.model, self.api_client, "summary")
-            self.summary_worker.summary_generated.connect(self.display_summary)
-            self.summary_worker.start()
+            self.start_summary_request(use_cache=False)  # 重新生成時略過快取
 
     def send_chat_message(self):
         """處理用戶聊天輸入"""
         user_input = self.chat_input.text()
         if user_input.strip() == "":
             return
+        if not self.current_transcript:
+            self.system_message_display.append("逐字稿尚未載入完成，請稍後再試。")
+            return
 
         # 更新聊天歷史並顯示
-        self.current_chat_history.append({"role": "user", "content": user_input})
+        self.current_chat_history.add("user", user_input)
 
         # 使用 HTML 顯示用戶消息
         self.chat_display.append(
@@ -415,42 +595,102 @@ class VideoTranscriptsApp(QWidget):
         )
         self.chat_input.clear()
 
-        # 如果這是第一次發送聊天訊息，加入逐字稿內容
-        if not self.transcript_sent:
-            initial_prompt = [
-                {"role": "system", "content": "你是一個聊天助手，請根據以下逐字稿內容回答用戶的問題。回答時使用html格式做回覆，不要有任何多餘的符號，不要隨意加粗或放大字體。"},
-                {"role": "user", "content": "逐字稿內容: " + self.current_transcript}
-            ]
-            self.current_chat_history = initial_prompt + self.current_chat_history
-            self.transcript_sent = True
-
-        # 創建一個 worker 來處理聊天回應
-        self.chat_worker = SummaryWorker(
-            content=self.current_chat_history,
-            use_openai=self.use_openai,
-            model=self.model,
-            client=self.api_client,
-            mode="chat"
+        # 逐字稿內容不存入聊天歷史，每一輪依問題重新挑選相關段落
+        history = self.current_chat_history
+        turn_count = len(history.turns)
+        client = self.api_client
+        model = self.model
+        transcript = self.current_transcript
+        search_all = self.search_all_checkbox.isChecked()
+        if search_all:
+            transcript_paths = list(self.transcript_titles)
+            pending = self.retriever.schedule_missing(transcript_paths)
+            if pending:
+                self.system_message_display.append(f"尚有 {pending} 份逐字稿正在背景建立索引，這次只搜尋已建立索引的集數。")
+        else:
+            transcript_paths = [self.current_video_info['transcript_path']]
+
+        # 交給工作池處理聊天回應；回應會寫回發出問題的那部影片的聊天歷史
+        request_id = self.request_manager.submit_chat(
+            lambda: self.build_chat_messages(history, turn_count, user_input, transcript, transcript_paths, client, model,
+                                             build_missing=not search_all),
+            client,
+            model,
         )
-        self.chat_worker.summary_generated.connect(self.display_chat_response)
-        self.chat_worker.start()
-
-    def display_chat_response(self, response):
-        """顯示聊天回應"""
-        self.current_chat_history.append({"role": "assistant", "content": response})
-
-        # 使用 HTML 顯示助手消息
-        self.chat_display.append(
+        self.chat_requests[request_id] = {
+            'transcript_path': self.current_video_info['transcript_path'],
+            'history': self.current_chat_history,
+            'text': "",
+            'cursor': None,  # 串流中的助手消息在聊天視窗中的範圍
+        }
+
+    def build_chat_messages(self, history, turn_count, question, transcript, transcript_paths, client, model, build_missing=True):
+        """組合送出的聊天訊息（在 worker thread 中執行）"""
+        summary, recent_turns = history.prompt_history(model, lambda messages: client.complete(model, messages), turn_count)
+        if self.retriever is None:
+            # 未安裝向量模型套件時，沿用送出完整逐字稿的方式
+            context = "逐字稿內容: " + transcript
+        else:
+            passages = self.retriever.search(question, transcript_paths, build_missing=build_missing)
+            context = "相關逐字稿段落:\n" + "\n\n".join(
+                f"【{self.transcript_titles.get(path, '')}】{chunk}" for path, chunk, _ in passages
+            )
+        messages = [{"role": "system", "content": CHAT_SYSTEM_PROMPT}, {"role": "user", "content": context}]
+        if summary:
+            messages.append({"role": "system", "content": "先前對話摘要: " + summary})
+        return messages + recent_turns
+
+    def assistant_message_html(self, response):
+        """助手消息的 HTML"""
+        return (
             f'<div style="color:#000000; padding:8px; border-radius:5px; margin:5px 0; display:flex; align-items:center;">'
             f'<img src="icons/assistant_icon2.png" alt="Assistant Icon" style="width:24px; height:24px; margin-right:8px; vertical-align:top;">'
             f'<span style="line-height: 24px;">{" "+response}</span></div>'
         )
 
+    def render_streaming_chat(self, request, response):
+        """以目前收到的內容重新繪製正在串流的助手消息
+
+        每個請求各自保存選取其消息的游標；游標會隨文件內容的增刪自動調整位置，
+        同時有多個回應在串流時只會改寫自己的那一段。
+        """
+        cursor = request['cursor']
+        if cursor is None:
+            self.chat_display.append(self.assistant_message_html(response))
+            cursor = QTextCursor(self.chat_display.document().lastBlock())
+            cursor.movePosition(QTextCursor.EndOfBlock, QTextCursor.KeepAnchor)
+            # 之後附加在後面的消息不併入這段選取範圍
+            cursor.setKeepPositionOnInsert(True)
+            request['cursor'] = cursor
+        else:
+            start = cursor.selectionStart()
+            cursor.setKeepPositionOnInsert(False)
+            cursor.removeSelectedText()
+            cursor.insertHtml(self.assistant_message_html(response))
+            end = cursor.position()
+            cursor.setPosition(start)
+            cursor.setPosition(end, QTextCursor.KeepAnchor)
+            cursor.setKeepPositionOnInsert(True)
+        self.chat_display.ensureCursorVisible()
+
+    def display_chat_response(self, request, response):
+        """聊天回應完成：加入發出問題的影片的聊天歷史，若正在檢視該影片則顯示"""
+        request['history'].add("assistant", response)
+
+        # 使用 HTML 顯示助手消息（取代串流過程中的暫時內容）
+        if self.is_current_chat(request):
+            self.render_streaming_chat(request, response)
+
+    def closeEvent(self, event):
+        """關閉視窗時取消所有進行中的請求"""
+        self.request_manager.shutdown()
+        super().closeEvent(event)
+
 
 
-# Load data from JSON file
-file_path = './transcriptions/metadata.json'
-data = load_json_data(file_path)
+# Load data from the metadata database (imports ./transcriptions/metadata.json on first run)
+metadata_store = open_metadata_store('./transcriptions/metadata.db')
+data = metadata_store.load_grouped()
 
 # Create the application
 app = QApplication(sys.argv)
@@ -474,6 +714,6 @@ app.setStyleSheet("""
     }
 """)
 
-viewer = VideoTranscriptsApp(data, file_path)
+viewer = VideoTranscriptsApp(data, metadata_store)
 viewer.show()
 sys.exit(app.exec_())
@@ -0,0 +1,204 @@
+import hashlib
+import json
+import os
+import queue
+import threading
+
+# 本地 CPU 向量模型（中文），第一次使用時才載入
+EMBEDDING_MODEL_ID = "BAAI/bge-small-zh-v1.5"
+# bge 系列模型建議在檢索用的查詢前加上的指令
+QUERY_INSTRUCTION = "为这个句子生成表示以用于检索相关文章："
+
+
+def split_transcript(text, chunk_chars=400, overlap_chars=80):
+    """將逐字稿切成固定長度、彼此重疊的段落，盡量在句尾標點處切開"""
+    text = ' '.join(text.split())
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + chunk_chars, len(text))
+        if end < len(text):
+            # 在段落後半部尋找句尾標點，避免把句子從中間切斷
+            for i in range(end, start + chunk_chars // 2, -1):
+                if text[i - 1] in '。！？!?；;':
+                    end = i
+                    break
+        chunks.append(text[start:end])
+        if end >= len(text):
+            break
+        start = max(end - overlap_chars, start + 1)
+    return chunks
+
+
+class TranscriptRetriever:
+    """逐字稿向量索引
+
+    每份逐字稿只切段並計算向量一次，結果存放在 index_dir（向量為 .npy，段落文字為 .json），
+    逐字稿內容改變（修改時間或大小不同）時才重新建立。
+    逐字稿儲存時即建立索引；尚未建立的逐字稿可交給背景執行緒依序補上，計算向量時不佔用共用的鎖。
+    """
+
+    def __init__(self, index_dir='./transcriptions/.vector_index', model_id=EMBEDDING_MODEL_ID):
+        self.index_dir = index_dir
+        self.model_id = model_id
+        self.model = None
+        self.model_lock = threading.Lock()
+        self.indexes = {}  # 逐字稿路徑 -> (簽章, 段落列表, 向量矩陣)
+        self.build_locks = {}  # 逐字稿路徑 -> 建立該索引時使用的鎖，避免同一份逐字稿重複計算
+        self.pending = set()  # 已排入背景建立、尚未完成的逐字稿
+        self.build_queue = queue.Queue()
+        self.build_thread = None
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def is_available():
+        """檢查是否安裝了向量模型所需的套件"""
+        try:
+            import numpy  # noqa: F401
+            import sentence_transformers  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    def _get_model(self):
+        with self.model_lock:
+            if self.model is None:
+                from sentence_transformers import SentenceTransformer
+                self.model = SentenceTransformer(self.model_id, device='cpu')
+            return self.model
+
+    def _embed(self, texts):
+        return self._get_model().encode(texts, batch_size=32, normalize_embeddings=True, convert_to_numpy=True)
+
+    def _index_paths(self, transcript_path):
+        key = hashlib.sha1(os.path.abspath(transcript_path).encode('utf-8')).hexdigest()
+        base = os.path.join(self.index_dir, key)
+        return base + '.json', base + '.npy'
+
+    def _signature(self, transcript_path):
+        stat = os.stat(transcript_path)
+        return {'model_id': self.model_id, 'mtime': stat.st_mtime, 'size': stat.st_size}
+
+    def load_index(self, transcript_path):
+        """取得已建立的段落與向量，尚未建立或已過期時返回 None；逐字稿不存在時拋出 OSError"""
+        import numpy as np
+
+        signature = self._signature(transcript_path)
+        with self.lock:
+            cached = self.indexes.get(transcript_path)
+        if cached and cached[0] == signature:
+            return cached[1], cached[2]
+
+        meta_path, vectors_path = self._index_paths(transcript_path)
+        if os.path.exists(meta_path) and os.path.exists(vectors_path):
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            if meta['signature'] == signature:
+                vectors = np.load(vectors_path, mmap_mode='r')
+                with self.lock:
+                    self.indexes[transcript_path] = (signature, meta['chunks'], vectors)
+                return meta['chunks'], vectors
+        return None
+
+    def get_index(self, transcript_path):
+        """取得逐字稿的段落與向量，必要時建立並寫入磁碟"""
+        index = self.load_index(transcript_path)
+        if index is not None:
+            return index
+        with self.lock:
+            build_lock = self.build_locks.setdefault(transcript_path, threading.Lock())
+        with build_lock:
+            # 等待期間其他執行緒可能已建立好
+            index = self.load_index(transcript_path)
+            if index is None:
+                index = self._build_index(transcript_path)
+            return index
+
+    def _build_index(self, transcript_path):
+        import numpy as np
+
+        signature = self._signature(transcript_path)
+        with open(transcript_path, 'r', encoding='utf-8') as f:
+            chunks = split_transcript(f.read())
+        vectors = self._embed(chunks).astype(np.float32) if chunks else np.zeros((0, 1), dtype=np.float32)
+
+        meta_path, vectors_path = self._index_paths(transcript_path)
+        os.makedirs(self.index_dir, exist_ok=True)
+        np.save(vectors_path, vectors)
+        with open(meta_path, 'w', encoding='utf-8') as f:
+            json.dump({'transcript_path': transcript_path, 'signature': signature, 'chunks': chunks}, f, ensure_ascii=False)
+        with self.lock:
+            self.indexes[transcript_path] = (signature, chunks, vectors)
+        return chunks, vectors
+
+    def schedule(self, transcript_paths):
+        """將逐字稿排入背景執行緒依序建立索引（已建立的會直接略過）"""
+        with self.lock:
+            new_paths = [path for path in transcript_paths if path not in self.pending]
+            self.pending.update(new_paths)
+            if new_paths and self.build_thread is None:
+                self.build_thread = threading.Thread(target=self._build_worker, name='vector-index', daemon=True)
+                self.build_thread.start()
+        for path in new_paths:
+            self.build_queue.put(path)
+
+    def schedule_missing(self, transcript_paths):
+        """排入磁碟上還沒有索引檔的逐字稿，返回仍在等待建立的逐字稿數量"""
+        missing = [path for path in transcript_paths
+                   if os.path.exists(path) and not os.path.exists(self._index_paths(path)[1])]
+        self.schedule(missing)
+        with self.lock:
+            return len(self.pending)
+
+    def _build_worker(self):
+        while True:
+            transcript_path = self.build_queue.get()
+            try:
+                self.get_index(transcript_path)
+            except Exception as e:
+                print(f"建立向量索引失敗 {transcript_path}：{e}")
+            finally:
+                with self.lock:
+                    self.pending.discard(transcript_path)
+
+    def search(self, query, transcript_paths, top_k=6, build_missing=True):
+        """在指定的逐字稿中找出與問題最相關的段落，返回 [(逐字稿路徑, 段落, 分數)]
+
+        build_missing 為 False 時（跨集數搜尋整個影片庫）只搜尋已建立索引的逐字稿，
+        其餘排入背景建立，不讓一次提問等待整個影片庫計算向量；已移動或刪除的逐字稿直接略過。
+        """
+        import numpy as np
+
+        query_vector = self._embed([QUERY_INSTRUCTION + query])[0]
+        results = []
+        missing = []
+        for transcript_path in transcript_paths:
+            try:
+                index = self.get_index(transcript_path) if build_missing else self.load_index(transcript_path)
+            except OSError:
+                continue
+            if index is None:
+                missing.append(transcript_path)
+                continue
+            chunks, vectors = index
+            if not chunks:
+                continue
+            scores = np.asarray(vectors) @ query_vector
+            best = np.argsort(-scores)[:top_k]
+            results.extend((transcript_path, chunks[i], float(scores[i])) for i in best)
+        if missing:
+            self.schedule(missing)
+        results.sort(key=lambda item: item[2], reverse=True)
+        return results[:top_k]
+
+
+_retrievers = {}
+_retriever_lock = threading.Lock()
+
+
+def get_retriever(index_dir='./transcriptions/.vector_index'):
+    """取得共用的向量索引（同一個目錄只建立一次，向量模型也只載入一次）"""
+    with _retriever_lock:
+        if index_dir not in _retrievers:
+            _retrievers[index_dir] = TranscriptRetriever(index_dir)
+        return _retrievers[index_dir]
@@ -0,0 +1,42 @@
+import json
+import os
+
+from jsonl_file import append_jsonl, read_jsonl
+
+
+def checkpoint_path(audio_file):
+    return audio_file + '.checkpoint.jsonl'
+
+
+class TranscriptionCheckpoint:
+    """轉錄進度檔：每完成一個片段就附加一行，程序中斷後重新執行時略過已完成的片段
+
+    第一行記錄音訊與轉錄設定（含切段位置），設定不同時視為新的工作並清除舊進度；
+    最後一行若因中斷而不完整，讀取時略過。
+    """
+
+    def __init__(self, path, signature):
+        self.path = path
+        self.signature = json.loads(json.dumps(signature))  # 與讀回的內容比較時 tuple 需先轉成 list
+        self.completed = {}  # 片段編號 -> 段落列表
+        self._load()
+
+    def _load(self):
+        records = read_jsonl(self.path)
+        if records and records[0].get('type') == 'header' and records[0]['signature'] == self.signature:
+            for record in records[1:]:
+                if record.get('type') == 'part':
+                    self.completed[record['index']] = record['segments']
+            if self.completed:
+                print(f"從進度檔接續轉錄：已完成 {len(self.completed)} 個片段")
+            return
+        self.remove()
+        append_jsonl(self.path, {'type': 'header', 'signature': self.signature}, sync=True)
+
+    def record(self, index, segments):
+        self.completed[index] = segments
+        append_jsonl(self.path, {'type': 'part', 'index': index, 'segments': segments}, sync=True)
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
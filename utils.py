@@ -1,63 +1,212 @@
-from groq import Groq
-from openai import OpenAI
-from PyQt5.QtCore import QThread, pyqtSignal
-import json
+from PyQt5.QtCore import QObject, QThread, pyqtSignal
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import itertools
+import mmap
+import os
+import threading
+from llm_provider import RequestCancelled, RequestScope, get_provider_loop
+from summarizer import MapReduceSummarizer, SUMMARY_PROMPT
 
+# 兩個 provider 都經由共用的非同步連線池送出請求（含限速與重試），相同金鑰只建立一次
 def initialize_openai_client(api_key):
-    return OpenAI(api_key=api_key)
+    return get_provider_loop().get_client('openai', api_key)
 
 def initialize_groq_client(api_key):
-    return Groq(api_key=api_key)
-
-def get_openai_response(transcript, client, model):
-    completion = client.chat.completions.create(
-        model=model,
-        messages=transcript  # 使用完整的聊天歷史
-    )
-    message = completion.choices[0].message.content
-    return message
-
-def get_groq_response(transcript, client, model):
-    chat_completion = client.chat.completions.create(
-        messages=transcript,  # 使用完整的聊天歷史
-        model=model,
-    )
-    return chat_completion.choices[0].message.content.strip()
-
-def load_json_data(file_path):
-    with open(file_path, 'r', encoding='utf-8') as file:
-        return json.load(file)
-
-def save_json_data(file_path, data):
-    with open(file_path, 'w', encoding='utf-8') as file:
-        json.dump(data, file, ensure_ascii=False, indent=4)
+    return get_provider_loop().get_client('groq', api_key)
 
 def load_transcript(file_path):
     with open(file_path, 'r', encoding='utf-8') as file:
         return file.read()
 
-class SummaryWorker(QThread):
-    summary_generated = pyqtSignal(str)
+class TranscriptCache:
+    """最近讀取過的逐字稿（LRU），切回先前看過的影片時不需再讀檔"""
+
+    def __init__(self, max_entries=8):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def peek(self, file_path):
+        with self.lock:
+            if file_path in self.entries:
+                self.entries.move_to_end(file_path)
+                return self.entries[file_path]
+        return None
+
+    def get(self, file_path):
+        text = self.peek(file_path)
+        if text is None:
+            text = load_transcript(file_path)
+            with self.lock:
+                self.entries[file_path] = text
+                self.entries.move_to_end(file_path)
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+        return text
+
+transcript_cache = TranscriptCache()
+
+class TranscriptPager:
+    """以記憶體映射逐頁讀取逐字稿，顯示時只解碼目前這一頁"""
+
+    def __init__(self, file_path, page_bytes=32 * 1024):
+        self.file_path = file_path
+        self.page_bytes = page_bytes
+        self.file = open(file_path, 'rb')
+        self.size = os.fstat(self.file.fileno()).st_size
+        self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None
+        self.page_count = max(1, -(-self.size // page_bytes))
+
+    def _boundary(self, page):
+        """第 page 頁的起始位元組位置：盡量停在換行處，且不切斷 UTF-8 字元"""
+        offset = page * self.page_bytes
+        if offset <= 0:
+            return 0
+        if offset >= self.size:
+            return self.size
+        newline = self.mmap.find(b'\n', offset, min(offset + 512, self.size))
+        if newline != -1:
+            return newline + 1
+        while offset < self.size and (self.mmap[offset] & 0xC0) == 0x80:
+            offset += 1
+        return offset
+
+    def read_page(self, page):
+        if self.mmap is None:
+            return ""
+        return self.mmap[self._boundary(page):self._boundary(page + 1)].decode('utf-8', errors='replace')
+
+    def close(self):
+        if self.mmap is not None:
+            self.mmap.close()
+        self.file.close()
+
+class TranscriptLoader(QThread):
+    """在背景執行緒讀取完整逐字稿，避免大型檔案讓介面卡住"""
+    transcript_loaded = pyqtSignal(str, str)  # 逐字稿路徑, 逐字稿內容
+
+    def __init__(self, file_path):
+        super().__init__()
+        self.file_path = file_path
+
+    def run(self):
+        self.transcript_loaded.emit(self.file_path, transcript_cache.get(self.file_path))
+
+class FullTextSearchWorker(QThread):
+    """在背景執行緒搜尋全文檢索索引（第一次搜尋時先補上尚未索引的逐字稿）"""
+    results_ready = pyqtSignal(str, object)  # 查詢文字, 搜尋結果列表
 
-    def __init__(self, content, use_openai, model, client, mode):
+    def __init__(self, search_index, query, transcript_dir):
         super().__init__()
-        self.content = content
-        self.use_openai = use_openai
-        self.model = model
-        self.client = client
-        self.mode = mode  # 'summary' or 'chat'
+        self.search_index = search_index
+        self.query = query
+        self.transcript_dir = transcript_dir
 
     def run(self):
-        if self.mode == "summary":
-            summary_prompt = "你是一個專業的逐字稿摘要生成器。當你收到逐字稿時，請產生一份詳盡且專業的摘要。摘要應專注於總結主持人關於企業、股市、產業及經濟面的看法和觀點。最重要的是摘要必須包括逐字稿中提到的每一間企業，條列式列出整理整理主持人對這些企業的近期看法和相關消息，每個觀點都要包含在摘要內。若逐字稿中有廣告、業配或與上述主題無關的閒聊內容，請忽略。僅需列出摘要內容，不需要包含任何額外的對話或說明。使用繁體中文回復。回答時使用html格式做回覆，不要有任何多餘的符號，不要隨意加粗或放大字體。"
-            if self.use_openai:
-                summary = get_openai_response([{"role":"system", "content":summary_prompt}, {"role": "user", "content": "逐字稿: " + self.content}], self.client, self.model)
-            else:
-                summary = get_groq_response([{"role":"system", "content":summary_prompt}, {"role": "user", "content": "逐字稿: " + self.content}], self.client, self.model)
-            self.summary_generated.emit(summary)
-        elif self.mode == "chat":
-            if self.use_openai:
-                response = get_openai_response(self.content, self.client, self.model)
-            else:
-                response = get_groq_response(self.content, self.client, self.model)
-            self.summary_generated.emit(response)
+        if self.transcript_dir not in self.search_index.synced_dirs:
+            self.search_index.sync_directory(self.transcript_dir)
+        self.results_ready.emit(self.query, self.search_index.search(self.query))
+
+class LLMRequestManager(QObject):
+    """以工作池處理摘要與聊天請求
+
+    每個請求有自己的編號，所有訊號都帶著編號，介面只接收自己仍在等待的請求結果；
+    cancel() 以協作方式取消請求並中斷進行中的 HTTP 連線，不再使用 QThread.terminate()。
+    """
+    cache_checked = pyqtSignal(int, bool)  # 請求編號, 是否命中回應快取
+    chunk_generated = pyqtSignal(int, str)  # 請求編號, 串流中的每一段文字
+    response_generated = pyqtSignal(int, str)  # 請求編號, 完整的回覆
+    request_failed = pyqtSignal(int, str)  # 請求編號, 錯誤訊息
+
+    def __init__(self, cache=None, max_workers=4):
+        super().__init__()
+        self.cache = cache
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='llm-request')
+        self.request_ids = itertools.count(1)
+        self.scopes = {}  # 請求編號 -> RequestScope
+        self.lock = threading.Lock()
+
+    def submit_summary(self, transcript, client, model, use_cache=True):
+        """生成逐字稿摘要，返回請求編號；use_cache 為 False 時略過快取直接重新生成（結果仍會寫回快取）"""
+        messages = [{"role":"system", "content":SUMMARY_PROMPT}, {"role": "user", "content": "逐字稿: " + transcript}]
+
+        def respond(scope, messages, emit_chunk):
+            # 過長的逐字稿分段摘要後合併，各段結果也會寫入快取
+            summarizer = MapReduceSummarizer(
+                lambda m: client.complete(model, m, scope),
+                lambda m: client.stream(model, m, scope),
+                model,
+                cache=self.cache,
+            )
+            return summarizer.summarize(transcript, on_chunk=emit_chunk, use_cache=use_cache)
+
+        return self._submit(model, lambda: messages, respond, use_cache)
+
+    def submit_chat(self, prepare_messages, client, model):
+        """送出聊天請求，返回請求編號；prepare_messages 在工作執行緒中組合訊息（例如檢索相關段落）"""
+        def respond(scope, messages, emit_chunk):
+            chunks = []
+            for chunk in client.stream(model, messages, scope):
+                chunks.append(chunk)
+                emit_chunk(chunk)
+            return "".join(chunks).strip()
+
+        return self._submit(model, prepare_messages, respond, True)
+
+    def cancel(self, request_id):
+        """取消請求；已取消或已完成的請求不會再發出任何訊號"""
+        with self.lock:
+            scope = self.scopes.pop(request_id, None)
+        if scope:
+            scope.cancel()
+
+    def cancel_all(self):
+        with self.lock:
+            request_ids = list(self.scopes)
+        for request_id in request_ids:
+            self.cancel(request_id)
+
+    def shutdown(self):
+        self.cancel_all()
+        self.executor.shutdown(wait=False)
+
+    def _submit(self, model, prepare_messages, respond, use_cache):
+        request_id = next(self.request_ids)
+        scope = RequestScope()
+        with self.lock:
+            self.scopes[request_id] = scope
+        job = self.executor.submit(self._run, request_id, scope, model, prepare_messages, respond, use_cache)
+        scope.track(job)  # 尚未開始執行的請求被取消時直接從佇列移除
+        return request_id
+
+    def _run(self, request_id, scope, model, prepare_messages, respond, use_cache):
+        def emit_chunk(chunk):
+            scope.check()
+            self.chunk_generated.emit(request_id, chunk)
+
+        try:
+            scope.check()
+            messages = prepare_messages()
+            scope.check()
+            if self.cache and use_cache:
+                cached_response = self.cache.get(model, messages)
+                self.cache_checked.emit(request_id, cached_response is not None)
+                if cached_response is not None:
+                    emit_chunk(cached_response)
+                    self.response_generated.emit(request_id, cached_response)
+                    return
+
+            response = respond(scope, messages, emit_chunk)
+            if self.cache:
+                self.cache.put(model, messages, response)
+            scope.check()
+            self.response_generated.emit(request_id, response)
+        except RequestCancelled:
+            pass
+        except Exception as e:
+            if not scope.cancelled:
+                self.request_failed.emit(request_id, str(e))
+        finally:
+            with self.lock:
+                self.scopes.pop(request_id, None)
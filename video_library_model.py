@@ -0,0 +1,127 @@
+from PyQt5.QtCore import QAbstractItemModel, QModelIndex, QSortFilterProxyModel, Qt
+
+
+class ChannelNode:
+    def __init__(self, row, name, videos):
+        self.row = row
+        self.name = name
+        self.pending_videos = list(videos.items())  # 尚未載入到模型的 (標題, 影片資訊)
+        self.children = []
+
+
+class VideoNode:
+    def __init__(self, channel, row, title, video_info):
+        self.channel = channel
+        self.row = row
+        self.title = title
+        self.video_info = video_info
+
+
+class VideoLibraryModel(QAbstractItemModel):
+    """頻道 → 影片的兩層樹狀模型
+
+    啟動時只建立頻道節點，影片節點在頻道展開時才分批載入（fetchMore），
+    啟動時間不會隨影片數量增加。
+    """
+
+    VideoInfoRole = Qt.UserRole + 1
+    fetch_batch_size = 200
+
+    def __init__(self, data, parent=None):
+        super().__init__(parent)
+        self.channels = [ChannelNode(row, name, videos) for row, (name, videos) in enumerate(data.items())]
+
+    def index(self, row, column, parent=QModelIndex()):
+        if not self.hasIndex(row, column, parent):
+            return QModelIndex()
+        if not parent.isValid():
+            return self.createIndex(row, column, self.channels[row])
+        channel = parent.internalPointer()
+        return self.createIndex(row, column, channel.children[row])
+
+    def parent(self, index):
+        if not index.isValid():
+            return QModelIndex()
+        node = index.internalPointer()
+        if isinstance(node, VideoNode):
+            return self.createIndex(node.channel.row, 0, node.channel)
+        return QModelIndex()
+
+    def rowCount(self, parent=QModelIndex()):
+        if not parent.isValid():
+            return len(self.channels)
+        node = parent.internalPointer()
+        if isinstance(node, ChannelNode):
+            return len(node.children)
+        return 0
+
+    def columnCount(self, parent=QModelIndex()):
+        return 1
+
+    def hasChildren(self, parent=QModelIndex()):
+        if not parent.isValid():
+            return bool(self.channels)
+        node = parent.internalPointer()
+        return isinstance(node, ChannelNode) and bool(node.children or node.pending_videos)
+
+    def canFetchMore(self, parent):
+        if not parent.isValid():
+            return False
+        node = parent.internalPointer()
+        return isinstance(node, ChannelNode) and bool(node.pending_videos)
+
+    def fetchMore(self, parent):
+        if not self.canFetchMore(parent):
+            return
+        channel = parent.internalPointer()
+        batch = channel.pending_videos[:self.fetch_batch_size]
+        first_row = len(channel.children)
+        self.beginInsertRows(parent, first_row, first_row + len(batch) - 1)
+        for offset, (title, video_info) in enumerate(batch):
+            channel.children.append(VideoNode(channel, first_row + offset, title, video_info))
+        del channel.pending_videos[:len(batch)]
+        self.endInsertRows()
+
+    def fetch_all(self):
+        """載入所有影片節點（搜尋時需要完整的影片列表）"""
+        for channel in self.channels:
+            parent = self.createIndex(channel.row, 0, channel)
+            while self.canFetchMore(parent):
+                self.fetchMore(parent)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        node = index.internalPointer()
+        if role in (Qt.DisplayRole, Qt.ToolTipRole):
+            return node.title if isinstance(node, VideoNode) else node.name
+        if role == self.VideoInfoRole and isinstance(node, VideoNode):
+            return node.video_info
+        return None
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.NoItemFlags
+        if isinstance(index.internalPointer(), VideoNode):
+            return Qt.ItemIsEnabled | Qt.ItemIsSelectable
+        return Qt.ItemIsEnabled
+
+
+class VideoFilterProxyModel(QSortFilterProxyModel):
+    """依輸入文字過濾影片標題；頻道名稱符合時顯示該頻道所有影片"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setFilterCaseSensitivity(Qt.CaseInsensitive)
+        self.setRecursiveFilteringEnabled(True)
+
+    def set_filter_text(self, text):
+        if text:
+            self.sourceModel().fetch_all()
+        self.setFilterFixedString(text)
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        if super().filterAcceptsRow(source_row, source_parent):
+            return True
+        # 頻道名稱符合時，保留其下所有影片
+        return source_parent.isValid() and super().filterAcceptsRow(source_parent.row(), source_parent.parent())
@@ -0,0 +1,136 @@
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+
+from audio_pcm import SAMPLE_RATE
+
+VAD_MODES = ('energy', 'webrtc', 'off')
+
+
+def frame_energy_db(audio, frame_samples):
+    frame_count = len(audio) // frame_samples
+    # 直接在原始陣列的 view 上以 float64 累加平方和，不另外複製整段音訊
+    frames = audio[:frame_count * frame_samples].reshape(frame_count, frame_samples)
+    energy = np.einsum('ij,ij->i', frames, frames, dtype=np.float64) / frame_samples
+    return 10 * np.log10(energy + 1e-10)
+
+
+def energy_voiced_frames(audio, frame_samples, margin_db=12.0, floor_db=-55.0, min_voiced_ratio=0.05, min_spread_db=6.0):
+    """以能量判斷每一個音框是否有聲音
+
+    門檻依整段音訊的背景噪音（能量第 10 百分位）自動調整；整段都低於 floor_db 時視為靜音。
+    若這個門檻幾乎濾掉所有音框、但音量仍有起伏（整段都在說話、沒有安靜片段），改以最大聲的一成音框為準，
+    避免把內容全部濾掉；音量幾乎不變的訊號（持續的雜訊或音樂）則不視為人聲。
+    """
+    energy_db = frame_energy_db(audio, frame_samples)
+    noise_db = np.percentile(energy_db, 10)
+    loud_db = np.percentile(energy_db, 90)
+    if loud_db < floor_db:
+        return np.zeros(len(energy_db), dtype=bool)
+    threshold = max(noise_db + margin_db, floor_db)
+    if np.mean(energy_db > threshold) < min_voiced_ratio and loud_db - noise_db >= min_spread_db:
+        threshold = loud_db - margin_db
+    return energy_db > threshold
+
+
+def webrtc_voiced_frames(audio, frame_samples, sample_rate, aggressiveness=2):
+    """以 WebRTC VAD 模型判斷每一個音框是否為人聲（對音樂、環境聲的分辨比單純能量好）"""
+    import webrtcvad
+
+    vad = webrtcvad.Vad(aggressiveness)
+    pcm16 = (np.clip(audio, -1.0, 1.0) * 32767).astype('<i2')
+    frame_count = len(pcm16) // frame_samples
+    return np.array([
+        vad.is_speech(pcm16[i * frame_samples:(i + 1) * frame_samples].tobytes(), sample_rate)
+        for i in range(frame_count)
+    ], dtype=bool)
+
+
+def detect_speech(audio, sample_rate=SAMPLE_RATE, mode='energy', frame_seconds=0.03,
+                  min_speech_seconds=0.3, min_silence_seconds=0.8, padding_seconds=0.3):
+    """找出有人聲的區段，返回 [(開始樣本, 結束樣本)]
+
+    短於 min_silence_seconds 的停頓視為同一段，短於 min_speech_seconds 的聲音視為雜音，
+    每段前後各保留 padding_seconds，避免切掉字頭字尾。
+    """
+    frame_samples = int(sample_rate * frame_seconds)
+    if len(audio) < frame_samples:
+        return [(0, len(audio))] if len(audio) else []
+    if mode == 'webrtc':
+        voiced = webrtc_voiced_frames(audio, frame_samples, sample_rate)
+    else:
+        voiced = energy_voiced_frames(audio, frame_samples)
+
+    # 連續有聲的音框組成區段
+    edges = np.diff(np.concatenate(([0], voiced.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+
+    spans = []
+    max_gap = int(min_silence_seconds / frame_seconds)
+    for start, end in zip(starts, ends):
+        if spans and start - spans[-1][1] <= max_gap:
+            spans[-1][1] = end
+        else:
+            spans.append([start, end])
+
+    padding = int(padding_seconds * sample_rate)
+    speech = []
+    for start, end in spans:
+        if (end - start) * frame_seconds < min_speech_seconds:
+            continue
+        start = max(0, start * frame_samples - padding)
+        end = min(len(audio), end * frame_samples + padding)
+        if speech and start <= speech[-1][1]:
+            speech[-1] = (speech[-1][0], end)
+        else:
+            speech.append((start, end))
+    return speech
+
+
+def is_digital_silence(audio, max_amplitude=1e-4):
+    """整段音訊的振幅都低於 max_amplitude（約 -80 dBFS），視為完全無聲"""
+    return len(audio) == 0 or float(np.max(np.abs(audio))) < max_amplitude
+
+
+class GatedAudio:
+    """只保留人聲區段後的音訊，並可將其中的時間換算回原始音訊的時間"""
+
+    def __init__(self, audio, spans, sample_rate=SAMPLE_RATE):
+        self.sample_rate = sample_rate
+        self.gated_starts = []  # 每個區段在剪接後音訊中的開始秒數
+        self.original_starts = []  # 每個區段在原始音訊中的開始秒數
+        pieces = []
+        position = 0
+        for start, end in spans:
+            self.gated_starts.append(position / sample_rate)
+            self.original_starts.append(start / sample_rate)
+            pieces.append(audio[start:end])
+            position += end - start
+        self.audio = np.concatenate(pieces) if pieces else np.zeros(0, dtype=np.float32)
+        self.total_seconds = len(audio) / sample_rate
+        self.skipped_seconds = (len(audio) - position) / sample_rate
+
+    def to_original(self, seconds, is_end=False):
+        """剪接後的秒數換算回原始時間；段落結束時間剛好落在區段交界時，歸屬前一個區段"""
+        if seconds is None or not self.gated_starts:
+            return seconds
+        if is_end:
+            i = bisect_left(self.gated_starts, seconds) - 1
+        else:
+            i = bisect_right(self.gated_starts, seconds) - 1
+        i = max(i, 0)
+        return self.original_starts[i] + seconds - self.gated_starts[i]
+
+
+def gate_audio(audio, sample_rate=SAMPLE_RATE, mode='energy'):
+    """去除非人聲的部分，並印出略過的長度"""
+    if mode == 'off':
+        spans = [(0, len(audio))]
+    else:
+        spans = detect_speech(audio, sample_rate, mode)
+    gated = GatedAudio(audio, spans, sample_rate)
+    if mode != 'off' and gated.total_seconds:
+        print(f"語音偵測：略過 {gated.skipped_seconds:.1f} 秒非人聲音訊"
+              f"（共 {gated.total_seconds:.1f} 秒，{gated.skipped_seconds / gated.total_seconds:.0%}），分成 {len(spans)} 段")
+    return gated
@@ -2,54 +2,54 @@ import argparse
 from yt_dlp import YoutubeDL
 import os
 from datetime import datetime, timedelta
-from transformers import AutoModelForSpeechSeq2Seq, AutoProcessor, pipeline
 import time
-import torch
 import re
-import json 
-from difflib import SequenceMatcher
-
-def is_similar(title1, title2, threshold=0.7):
-    # 計算兩個字串的相似度
-    ratio = SequenceMatcher(None, title1, title2).ratio()
-    return ratio >= threshold
+import copy
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from dedup_index import DedupIndex, extract_video_id
+from metadata_store import open_metadata_store
+from search_index import get_search_index
+from segment_store import write_segments
+from audio_pcm import SAMPLE_RATE, decode_audio
+from voice_activity import VAD_MODES, gate_audio, is_digital_silence
+from asr_backends import ASR_BACKENDS
+from parallel_transcriber import split_at_silence, transcribe_in_parts
+from transcription_checkpoint import TranscriptionCheckpoint, checkpoint_path
+from transcript_retriever import TranscriptRetriever, get_retriever
 
 def get_video_info(video_url, output_dir):
+    """提取一次影片資訊，供字幕、音訊、縮圖及元數據各階段共用"""
     with YoutubeDL({'quiet': True}) as ydl:
         info_dict = ydl.extract_info(video_url, download=False)
 
     channel_name = info_dict.get('uploader', 'Unknown Channel')
-    video_title = info_dict.get('title', None)
+    video_title = info_dict.get('title', 'Unknown')
     info_dict['title'] = re.sub(r'[\/:*?"<>|]', '_', video_title)
     info_dict['transcript_dir'] = os.path.join(output_dir, channel_name)
     os.makedirs(info_dict['transcript_dir'], exist_ok=True)
     return info_dict
 
-def download_subtitles(video_url, output_dir):
+def download_subtitles(info_dict, subtitle_lang='zh-TW'):
     """檢查並下載影片字幕，返回字幕檔案路徑，如果無字幕則返回 None"""
-    with YoutubeDL({'quiet': True}) as ydl:
-        info_dict = ydl.extract_info(video_url, download=False)
-
-    channel_name = info_dict.get('uploader', 'Unknown Channel')
-    video_title = info_dict.get('title', None)
-    video_title = re.sub(r'[\/:*?"<>|]', '_', video_title)
-    transcript_dir = os.path.join(output_dir, channel_name)
-    os.makedirs(transcript_dir, exist_ok=True)
+    transcript_dir = info_dict['transcript_dir']
+    video_title = info_dict['title']
 
     # 設定下載字幕的選項
     ydl_opts_subtitles = {
         'writesubtitles': True,  # 下載字幕
         'skip_download': True,   # 不下載影片本身
-        'subtitleslangs': ['zh-TW'],  # 指定字幕語言（可根據需求調整
+        'subtitleslangs': [subtitle_lang],  # 指定字幕語言（可根據需求調整
         'outtmpl': os.path.join(transcript_dir, f'{video_title}.%(ext)s'),  # 字幕檔名
         'quiet': True,
     }
 
+    # 直接使用已提取的影片資訊，避免再次請求頁面
     with YoutubeDL(ydl_opts_subtitles) as ydl:
-        ydl.download([video_url])  # 下載字幕
+        ydl.process_ie_result(copy.deepcopy(info_dict), download=True)  # 下載字幕
 
     # 檢查字幕文件是否存在
-    subtitle_path = os.path.join(transcript_dir, f"{video_title}.zh-TW.vtt")  # 假設字幕格式為 .vtt
+    subtitle_path = os.path.join(transcript_dir, f"{video_title}.{subtitle_lang}.vtt")  # 假設字幕格式為 .vtt
     if os.path.exists(subtitle_path):
         print(f"字幕已下載：{subtitle_path}")
         return subtitle_path
@@ -65,128 +65,136 @@ def clean_emoji(desstr,restr=''):
         co = re.compile(u'('u'\ud83c[\udf00-\udfff]|'u'\ud83d[\udc00-\ude4f\ude80-\udeff]|'u'[\u2600-\u2B55])+')  
     return co.sub(restr,desstr)
 
-# 新增函數：讀取現有的 JSON 文件（如果存在）
-def load_metadata_from_json(json_path):
-    if os.path.exists(json_path):
-        with open(json_path, 'r', encoding='utf-8') as json_file:
-            metadata = json.load(json_file)
-        print(f"已載入現有的元數據。")
-    else:
-        metadata = {}
-        print(f"未找到現有元數據，將創建新的元數據文件。")
-    return metadata
-
-# 新增函數：儲存元數據到 JSON 文件
-def save_metadata_to_json(metadata, json_path):
-    with open(json_path, 'w', encoding='utf-8') as json_file:
-        json.dump(metadata, json_file, ensure_ascii=False, indent=4)
-    print(f"元數據已儲存到 {json_path}")
-
-# Step 1: 提取 YouTube 頻道中近五天的影片網址
-def get_video_urls(channel_url):
-    # 計算五天前的日期
-    cutoff_date = (datetime.now() - timedelta(days=7)).strftime('%Y%m%d')
+# 頻道同步進度：每個頻道最後看過的影片 ID 與上傳日期
+def update_channel_sync_state(metadata_store, channel_url, newest_entry, results):
+    """頻道中所有影片都處理完成後，將最新的影片記錄為下次同步的起點"""
+    if newest_entry is None:
+        return
+    upload_dates = [r['info_dict']['upload_date'] for r in results if r['info_dict'].get('upload_date')]
+    previous = metadata_store.get_sync_state(channel_url)
+    last_upload_date = newest_entry.get('upload_date') or max(upload_dates, default=previous.get('last_upload_date'))
+    metadata_store.set_sync_state(channel_url, newest_entry['id'], last_upload_date)
+    print(f"已更新頻道同步進度：{channel_url} -> {newest_entry['id']}")
+
+# Step 1: 提取 YouTube 頻道中近期的影片網址
+def get_video_urls(channel_url, days=7, min_duration=1800, last_video_id=None):
+    """返回由新到舊排列的影片網址，以及頻道最新一部影片的資訊
+
+    若提供 last_video_id（上次同步看過的最新影片），列表在遇到該影片時即停止，
+    沒有新影片時不需要再逐一提取影片資訊。
+    """
+    # 計算回溯天數前的日期
+    cutoff_date = (datetime.now() - timedelta(days=days)).strftime('%Y%m%d')
 
     # 設定 yt-dlp 選項，使用 dateafter 篩選條件
     ydl_opts = {
         'extract_flat': True,  # 不下載影片，只提取資訊
         'skip_download': True,  # 跳過下載
         'quiet': True,  # 避免輸出過多訊息
-        'dateafter': cutoff_date,  # 篩選五天前的影片
-        'playlistreverse': True,  # 從最新的影片開始
-        'playlist_items': '1:20',  # 限制檢查的影片數量，避免處理整個頻道
+        'dateafter': cutoff_date,  # 篩選回溯天數內的影片
+        'playlist_items': '1:20',  # 限制檢查的影片數量，避免處理整個頻道（頻道列表預設由新到舊）
     }
 
     # 使用 yt-dlp 提取影片網址
     with YoutubeDL(ydl_opts) as ydl:
         info_dict = ydl.extract_info(channel_url, download=False)
 
-    # 獲取時長大於30分鐘的影片網址
+    entries = [entry for entry in info_dict['entries'] if entry]
+    newest_entry = entries[0] if entries else None
+
+    # 獲取時長大於 min_duration（預設 30 分鐘 = 1800 秒）的影片網址
     video_urls = []
-    for entry in info_dict['entries']:
-        duration = entry.get('duration', 0)  # 影片長度（秒）
-        if duration > 1800:  # 30分鐘 = 1800秒
+    for entry in entries:
+        if last_video_id and entry.get('id') == last_video_id:
+            print("已到達上次同步的影片，停止列出較舊的影片")
+            break
+        duration = entry.get('duration') or 0  # 影片長度（秒）
+        if duration > min_duration:
             video_urls.append(entry['url'])
 
-    return video_urls
+    return video_urls, newest_entry
 
 # Step 2: 下載 YouTube 影片音訊並轉換為 MP3 格式
-def download_audio_and_thumbnail(video_url, output_dir):
-    # 使用 yt-dlp 提取影片資訊（不下載）
-    with YoutubeDL({'quiet': True}) as ydl:
-        info_dict = ydl.extract_info(video_url, download=False)
-
-    channel_name = info_dict.get('uploader', 'Unknown Channel')
-    transcript_dir = os.path.join(output_dir, channel_name)
-    os.makedirs(transcript_dir, exist_ok=True)  # 創建節目資料夾
+def download_audio_and_thumbnail(info_dict, audio_mode='pcm'):
+    """下載音訊與縮圖
 
-    video_title = info_dict.get('title', None)
-    video_title = re.sub(r'[\/:*?"<>|]', '_', video_title)
+    audio_mode 為 'pcm' 時保留原始音訊串流，轉錄時才一次解碼成 16 kHz PCM；
+    為 'mp3' 時沿用舊的方式先轉成 192 kbps MP3。
+    """
+    transcript_dir = info_dict['transcript_dir']
+    video_title = info_dict['title']
 
-    # 設定下載選項（音訊）
+    # 設定下載選項（音訊與封面圖片一次完成）
     ydl_opts_audio = {
         'format': 'bestaudio/best',  # 僅下載最佳音質
         'outtmpl': os.path.join(transcript_dir, f'{video_title}.%(ext)s'),  # 使用截取的標題作為檔名
-        'postprocessors': [{  # 使用後處理器將檔案轉換為 MP3
+        'writethumbnail': True,  # 同時下載縮圖
+    }
+    if audio_mode == 'mp3':
+        ydl_opts_audio['postprocessors'] = [{  # 使用後處理器將檔案轉換為 MP3
             'key': 'FFmpegExtractAudio',
             'preferredcodec': 'mp3',  # 設定音訊格式為 mp3
             'preferredquality': '192',  # 設定音訊質量
-        }],
-    }
-
-    # 設定下載選項（封面圖片）
-    ydl_opts_thumbnail = {
-        'skip_download': True,  # 跳過下載影片
-        'writethumbnail': True,  # 下載縮圖
-        'outtmpl': os.path.join(transcript_dir, f'{video_title}.%(ext)s'),  # 縮圖使用截取的標題作為檔名
-        'quiet': True,
-    }
+        }]
+        # 讓 yt-dlp 認得已轉好的 MP3，上次中斷前已完成的下載不再重新下載
+        ydl_opts_audio['final_ext'] = 'mp3'
 
-    # 下載音訊
+    # 下載音訊及封面圖片（沿用已提取的影片資訊）
     with YoutubeDL(ydl_opts_audio) as ydl:
-        ydl.extract_info(video_url, download=True)
-
-    # 下載封面圖片
-    with YoutubeDL(ydl_opts_thumbnail) as ydl:
-        ydl.extract_info(video_url, download=True)
+        result = ydl.process_ie_result(copy.deepcopy(info_dict), download=True)
+        downloads = result.get('requested_downloads') or [{}]
+        source_file = downloads[0].get('filepath') or ydl.prepare_filename(result)
 
     # 生成音訊檔案路徑與縮圖檔案路徑
-    audio_file = os.path.join(transcript_dir, f"{video_title}.mp3")
+    if audio_mode == 'mp3':
+        audio_file = os.path.join(transcript_dir, f"{video_title}.mp3")
+    else:
+        audio_file = source_file
     thumbnail_file = os.path.join(transcript_dir, f"{video_title}.jpg")  # 假設縮圖檔案為 jpg 格式
 
     return audio_file, thumbnail_file, video_title
 
-# Step 3: 使用 Hugging Face Distil-Whisper 模型轉錄 MP3 為文字
-def transcribe_audio(audio_file):
+# Step 3: 使用 Whisper 模型轉錄音訊為文字
+def transcribe_audio(audio_file, vad='energy', asr_backend='hf', asr_model='medium', asr_threads=None, asr_processes=1):
+    """轉錄音訊，返回 (逐字稿文字, 段落列表)
+
+    vad 為 'energy' 或 'webrtc' 時先去除靜音、片頭音樂等非人聲部分，只轉錄人聲區段，
+    段落時間會換算回原始音訊的時間；'off' 則轉錄整段音訊。
+    asr_backend 可選 'hf'、'hf-int8' 或 'ctranslate2'，各種模型的輸出格式相同。
+    asr_processes 大於 1 時，長音訊在靜音處切段後交給多個程序同時轉錄（asr_threads 為每個程序的執行緒數）。
+    每轉錄完一段就寫入音訊旁的進度檔，程序中斷後重新執行會略過已完成的片段，全部完成後刪除進度檔。
+    音訊有聲音但語音偵測保留不到 1% 時改為轉錄整段音訊；完全無聲或轉錄不出文字時拋出 ValueError，
+    影片不會被記錄為已完成，下次執行會再嘗試。
+    """
 
     # 記錄開始時間
     start_time = time.time()
 
-    device = "cuda:0" if torch.cuda.is_available() else "cpu"
-    torch_dtype = torch.float16 if torch.cuda.is_available() else torch.float32
-
-    model_id = "openai/whisper-medium"
-
-    model = AutoModelForSpeechSeq2Seq.from_pretrained(
-        model_id, torch_dtype=torch_dtype, use_safetensors=True
-    )
-    model.to(device)
-
-    processor = AutoProcessor.from_pretrained(model_id)
-
-    pipe = pipeline(
-        "automatic-speech-recognition",
-        model=model,
-        tokenizer=processor.tokenizer,
-        feature_extractor=processor.feature_extractor,
-        max_new_tokens=128,
-        chunk_length_s=15,
-        batch_size=16,
-        torch_dtype=torch_dtype,
-        device=device,
-    )
-
-    transcription_text = pipe(audio_file)["text"]
+    # 音訊只解碼一次，直接以 16 kHz PCM 交給特徵擷取器；保留每一段的時間，另存為逐字稿旁的段落檔
+    audio = decode_audio(audio_file)
+    gated = gate_audio(audio, SAMPLE_RATE, vad)
+    if vad != 'off' and len(gated.audio) < 0.01 * len(audio) and not is_digital_silence(audio):
+        # 有聲音卻幾乎全被濾掉（例如人聲底下墊著音樂），多半是偵測失準，寧可轉錄整段音訊
+        print("語音偵測幾乎略過整段音訊，改為轉錄整段音訊")
+        vad = 'off'
+        gated = gate_audio(audio, SAMPLE_RATE, vad)
+    if len(gated.audio) == 0:
+        raise ValueError(f"音訊完全無聲，無法轉錄：{audio_file}")
+
+    # 切段位置固定（與程序數無關），進度檔才能在改變 --asr_processes 後繼續沿用
+    parts = split_at_silence(gated.audio, part_seconds=300)
+    signature = {'audio_size': os.path.getsize(audio_file), 'vad': vad, 'asr_backend': asr_backend,
+                 'asr_model': asr_model, 'parts': parts}
+    checkpoint = TranscriptionCheckpoint(checkpoint_path(audio_file), signature)
+    transcription_text, segments = transcribe_in_parts(gated.audio, parts, asr_processes, asr_backend, asr_model,
+                                                       asr_threads, checkpoint=checkpoint)
+    checkpoint.remove()
+    if not transcription_text.strip():
+        raise ValueError(f"沒有轉錄出任何文字：{audio_file}")
+    segments = [{'start': gated.to_original(segment['start']),
+                 'end': gated.to_original(segment['end'], is_end=True),
+                 'text': segment['text']}
+                for segment in segments]
 
     # 記錄結束時間
     end_time = time.time()
@@ -195,130 +203,351 @@ def transcribe_audio(audio_file):
     transcription_time = end_time - start_time
     print(f"轉錄音訊所花費的時間：{transcription_time:.2f} 秒")
 
-    return transcription_text
-
-# Function 1: 處理頻道 URL
-def process_channel_videos(channel_url, output_dir, json_path, use_similarity_check=False):
-    # 載入現有的元數據
-    global metadata
-    metadata = load_metadata_from_json(json_path)
-    
-    video_urls = get_video_urls(channel_url)
-    video_urls = video_urls[::-1]  # 反轉順序 (由新到舊)
-    print(f"取得的符合條件的影片數量：{len(video_urls)}")
-
-    for video_url in video_urls:
-        # 提取影片資訊
-        channel_name, video_title, upload_date, original_url = extract_video_info(video_url)
-        
-        print(f"\n處理影片：{video_title} - 上傳日期：{upload_date}")
-
-        if datetime.now() - upload_date > timedelta(days=7):
-            print(f"跳過較舊的影片")
-            break
+    return transcription_text, segments
+
+class VideoPipeline:
+    """分段處理影片：下載階段（字幕、音訊）與轉錄階段各自使用執行緒池，
+    讓網路下載與 Whisper 轉錄可以同時進行，每部影片完成時立即寫入元數據"""
+
+    def __init__(self, output_dir, metadata_store, download_workers=3, transcribe_workers=1, audio_mode='pcm', transcribe_options=None):
+        self.output_dir = output_dir
+        self.audio_mode = audio_mode
+        self.transcribe_options = transcribe_options or {}  # 傳給 transcribe_audio 的參數
+        self.metadata_store = metadata_store
+        self.index_lock = threading.Lock()
+        # 去重索引只在啟動時建立一次，之後隨每部完成的影片增量更新
+        self.dedup_index = DedupIndex.from_metadata(metadata_store.load_grouped())
+        self.download_pool = ThreadPoolExecutor(max_workers=download_workers, thread_name_prefix='download')
+        self.transcribe_pool = ThreadPoolExecutor(max_workers=transcribe_workers, thread_name_prefix='transcribe')
+        # 限制已下載但尚未轉錄的影片數量，避免預先下載過多音訊檔
+        self.in_flight = threading.BoundedSemaphore(download_workers + transcribe_workers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.download_pool.shutdown(wait=True)
+        self.transcribe_pool.shutdown(wait=True)
+
+    def submit(self, video_url, use_similarity_check=False, max_age_days=7, subtitle_lang='zh-TW'):
+        """排入一部影片，返回的 Future 會在影片處理完成（或被跳過）時給出結果"""
+        result_future = Future()
+
+        def on_downloaded(download_future):
+            try:
+                job = download_future.result()
+            except Exception as e:
+                result_future.set_exception(e)
+                return
+            if job['status'] != 'downloaded':
+                result_future.set_result(job)
+                return
+            transcribe_future = self.transcribe_pool.submit(self._transcribe_stage, job)
+            transcribe_future.add_done_callback(lambda f: _copy_future_result(f, result_future))
+
+        download_future = self.download_pool.submit(self._download_stage, video_url, use_similarity_check, max_age_days, subtitle_lang)
+        download_future.add_done_callback(on_downloaded)
+        return result_future
+
+    def _download_stage(self, video_url, use_similarity_check, max_age_days, subtitle_lang):
+        """提取影片資訊並下載字幕或音訊；有字幕的影片在此階段直接完成"""
+        start_time = time.time()
+
+        # 以網址中的影片 ID 先行比對，已處理過的影片不需再提取影片資訊
+        with self.index_lock:
+            already_processed = self.dedup_index.contains_id(extract_video_id(video_url))
+        if already_processed:
+            print(f"\n影片已處理過，跳過影片: {video_url}")
+            return {'info_dict': {}, 'title': video_url, 'duration': 0, 'start_time': start_time, 'status': 'skipped'}
+
+        # 先取得名額再提取影片資訊：轉錄落後時在此等待，提取到的下載網址（數小時後失效）不會放到過期
+        self.in_flight.acquire()
+        downloaded = False
+        try:
+            # 提取影片資訊（僅請求一次，後續各階段共用）
+            info_dict = get_video_info(video_url, self.output_dir)
+            channel_name, video_title, upload_date, original_url = extract_video_info(info_dict)
+            job = {'info_dict': info_dict, 'title': video_title, 'duration': info_dict.get('duration') or 0, 'start_time': start_time}
+
+            print(f"\n處理影片：{video_title} - 上傳日期：{upload_date}")
+
+            if datetime.now() - upload_date > timedelta(days=max_age_days):
+                print(f"跳過較舊的影片")
+                return dict(job, status='skipped')
+
+            if self._transcript_exists(info_dict.get('id'), channel_name, video_title, upload_date, use_similarity_check):
+                return dict(job, status='skipped')
+
+            # 嘗試下載字幕
+            subtitle_file = download_subtitles(info_dict, subtitle_lang)
+
+            if subtitle_file:
+                # 如果找到字幕，清理字幕並存儲
+                transcription_text, segments = clean_subtitles(subtitle_file)
+                os.remove(subtitle_file)  # 刪除原始字幕文件
+                self._record(info_dict, transcription_text, segments)
+                return dict(job, status='subtitles', elapsed=time.time() - start_time)
+
+            # 如果沒有字幕，下載音訊，交給轉錄階段處理（名額在轉錄完成後才釋放）
+            audio_file, thumbnail_file, truncated_title = download_audio_and_thumbnail(info_dict, self.audio_mode)
+            downloaded = True
+        finally:
+            if not downloaded:
+                self.in_flight.release()
+        return dict(job, status='downloaded', audio_file=audio_file)
+
+    def _transcribe_stage(self, job):
+        try:
+            transcription_text, segments = transcribe_audio(job['audio_file'], **self.transcribe_options)
+            self._record(job['info_dict'], transcription_text, segments)
+        finally:
+            self.in_flight.release()
+        return dict(job, status='transcribed', elapsed=time.time() - job['start_time'])
+
+    def _transcript_exists(self, video_id, channel_name, video_title, upload_date, use_similarity_check):
+        with self.index_lock:
+            if self.dedup_index.contains_id(video_id):
+                print(f"影片已處理過，跳過影片: {video_title}")
+                return True
+            similar_title = self.dedup_index.find_similar(channel_name, video_title) if use_similarity_check else None
 
         # 選擇使用相似度比對或是檔案是否存在的檢查方法
         if use_similarity_check:
-            # 使用相似度比對方法檢查是否存在相似的逐字稿
-            transcript_exists = False
-            if channel_name in metadata:
-                for existing_title in metadata[channel_name].keys():
-                    if is_similar(video_title, existing_title):
-                        print(f"發現相似的逐字稿，跳過影片: {video_title}")
-                        transcript_exists = True
-                        break
-            if transcript_exists:
-                continue
+            # 使用標題相似度索引檢查是否存在相似的逐字稿（例如重新上傳的影片）
+            if similar_title is not None:
+                print(f"發現相似的逐字稿（{similar_title}），跳過影片: {video_title}")
+                return True
         else:
             # 使用原本的方法檢查逐字稿檔案是否存在
-            transcript_path = os.path.join(output_dir, channel_name, f"{channel_name}_{upload_date.strftime('%Y-%m-%d')}_{video_title}.txt")
+            transcript_path = os.path.join(self.output_dir, channel_name, f"{channel_name}_{upload_date.strftime('%Y-%m-%d')}_{video_title}.txt")
             if os.path.exists(transcript_path):
                 print(f"逐字稿已存在，跳過影片: {video_title}")
-                continue
+                return True
+        return False
 
-        # 嘗試下載字幕
-        subtitle_file = download_subtitles(video_url, output_dir)
+    def _record(self, info_dict, transcription_text, segments=None):
+        """儲存逐字稿並立即寫入元數據，中途中斷也不會遺失已完成的影片"""
+        channel_name, video_title, upload_date, original_url = extract_video_info(info_dict)
+        transcript_path = save_transcription(transcription_text, self.output_dir, channel_name, upload_date, video_title, segments)
+        update_metadata(self.metadata_store, channel_name, video_title, upload_date, original_url, transcript_path)
+        with self.index_lock:
+            self.dedup_index.add(channel_name, video_title, info_dict.get('id'))
 
-        if subtitle_file:
-            # 如果找到字幕，清理字幕並存儲
-            transcription_text = clean_subtitles(subtitle_file)
-            os.remove(subtitle_file)  # 刪除原始字幕文件
-        else:
-            # 如果沒有字幕，下載音訊並進行轉錄
-            audio_file, thumbnail_file, truncated_title = download_audio_and_thumbnail(video_url, output_dir)
-            transcription_text = transcribe_audio(audio_file)
 
-        # 儲存轉錄文字到檔案
-        transcript_path = save_transcription(transcription_text, output_dir, channel_name, upload_date, video_title)
+def _copy_future_result(source, target):
+    if source.exception() is not None:
+        target.set_exception(source.exception())
+    else:
+        target.set_result(source.result())
 
-        # 更新元數據
-        update_metadata(metadata, channel_name, video_title, upload_date, original_url, transcript_path)
-    
-    # 儲存更新後的元數據到 JSON
-    save_metadata_to_json(metadata, json_path)
 
-# Function 2: 處理單個影片 URL
-def process_single_video(video_url, output_dir, json_path):
-    global metadata
-    metadata = load_metadata_from_json(json_path)
+# Function 1: 處理頻道 URL
+def process_channel_videos(channel_url, output_dir, metadata_path, use_similarity_check=False, download_workers=3, transcribe_workers=1, full_sync=False, audio_mode='pcm', transcribe_options=None):
+    metadata_store = open_metadata_store(metadata_path)
+    last_video_id = None if full_sync else metadata_store.get_sync_state(channel_url).get('last_video_id')
+    video_urls, newest_entry = get_video_urls(channel_url, last_video_id=last_video_id)
+    print(f"取得的符合條件的影片數量：{len(video_urls)}")
+    if not video_urls:
+        update_channel_sync_state(metadata_store, channel_url, newest_entry, [])
+        metadata_store.close()
+        return
+
+    results = []
+    failed = False
+    with VideoPipeline(output_dir, metadata_store, download_workers, transcribe_workers, audio_mode, transcribe_options) as video_pipeline:
+        futures = {video_pipeline.submit(video_url, use_similarity_check): video_url for video_url in video_urls}
+        for future in as_completed(futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                print(f"處理影片時發生錯誤 {futures[future]}：{e}")
+                failed = True
+
+    # 有影片失敗時不推進同步進度，下次會再嘗試（已完成的影片會被去重跳過）
+    if not failed:
+        update_channel_sync_state(metadata_store, channel_url, newest_entry, results)
+    metadata_store.close()
 
+# Function 2: 處理單個影片 URL
+def process_single_video(video_url, output_dir, metadata_path, audio_mode='pcm', transcribe_options=None):
     print(f"\n開始下載和轉錄影片音訊: {video_url}")
 
+    # 提取影片資訊（僅請求一次，後續各階段共用）
+    info_dict = get_video_info(video_url, output_dir)
+
     # 優先嘗試下載字幕
-    subtitle_file = download_subtitles(video_url, output_dir)
+    subtitle_file = download_subtitles(info_dict)
 
     if subtitle_file:
-        transcription_text = clean_subtitles(subtitle_file)
+        transcription_text, segments = clean_subtitles(subtitle_file)
         os.remove(subtitle_file)  # 刪除字幕文件
     else:
         # 沒有字幕的情況下，進行音訊下載和轉錄
-        audio_file, thumbnail_file, video_title = download_audio_and_thumbnail(video_url, output_dir)
-        transcription_text = transcribe_audio(audio_file)
+        audio_file, thumbnail_file, video_title = download_audio_and_thumbnail(info_dict, audio_mode)
+        transcription_text, segments = transcribe_audio(audio_file, **(transcribe_options or {}))
 
     # 提取和處理影片信息
-    channel_name, video_title, upload_date, original_url = extract_video_info(video_url)
+    channel_name, video_title, upload_date, original_url = extract_video_info(info_dict)
 
     # 儲存轉錄文字
-    transcript_path = save_transcription(transcription_text, output_dir, channel_name, upload_date, video_title)
-    
-    # 更新元數據
-    update_metadata(metadata, channel_name, video_title, upload_date, original_url, transcript_path)
+    transcript_path = save_transcription(transcription_text, output_dir, channel_name, upload_date, video_title, segments)
     
-    # 儲存更新後的元數據到 JSON
-    save_metadata_to_json(metadata, json_path)
+    # 更新元數據（單筆寫入資料庫）
+    metadata_store = open_metadata_store(metadata_path)
+    update_metadata(metadata_store, channel_name, video_title, upload_date, original_url, transcript_path)
+    metadata_store.close()
+
+
+# 批次模式：頻道清單檔案中每一行的可用選項及預設值
+CHANNEL_OPTION_DEFAULTS = {'days': 7, 'min_duration': 1800, 'lang': 'zh-TW'}
+
+def load_channel_list(list_path):
+    """讀取頻道清單檔案
+
+    每行格式為「頻道網址 [days=7] [min_duration=1800] [lang=zh-TW]」，
+    空行與 # 開頭的註解行會被忽略。
+    """
+    channels = []
+    with open(list_path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            url, *option_items = line.split()
+            options = dict(CHANNEL_OPTION_DEFAULTS)
+            for item in option_items:
+                key, sep, value = item.partition('=')
+                if not sep or key not in CHANNEL_OPTION_DEFAULTS:
+                    raise ValueError(f"{list_path} 第 {line_number} 行有無法辨識的選項：{item}")
+                options[key] = type(CHANNEL_OPTION_DEFAULTS[key])(value)
+            channels.append((url, options))
+    return channels
+
+# Function 3: 以單一程序批次處理頻道清單中的所有頻道
+def process_channel_batch(list_path, output_dir, metadata_path, use_similarity_check=False, download_workers=3, transcribe_workers=1, full_sync=False, audio_mode='pcm', transcribe_options=None):
+    channels = load_channel_list(list_path)
+    metadata_store = open_metadata_store(metadata_path)
+    print(f"共讀取 {len(channels)} 個頻道")
+    batch_start = time.time()
+    stats = {url: {'found': 0, 'subtitles': 0, 'transcribed': 0, 'skipped': 0, 'failed': 0,
+                   'audio_seconds': 0, 'finished_at': batch_start, 'newest_entry': None, 'results': []}
+             for url, _ in channels}
+
+    with VideoPipeline(output_dir, metadata_store, download_workers, transcribe_workers, audio_mode, transcribe_options) as video_pipeline:
+        # 頻道列表也在下載執行緒池中同時取得
+        listing_futures = {
+            video_pipeline.download_pool.submit(get_video_urls, url, options['days'], options['min_duration'],
+                                                None if full_sync else metadata_store.get_sync_state(url).get('last_video_id')): (url, options)
+            for url, options in channels
+        }
+
+        video_futures = {}
+        for listing_future in as_completed(listing_futures):
+            channel_url, options = listing_futures[listing_future]
+            try:
+                video_urls, stats[channel_url]['newest_entry'] = listing_future.result()
+            except Exception as e:
+                print(f"無法取得頻道影片列表 {channel_url}：{e}")
+                stats[channel_url]['failed'] += 1
+                continue
+            stats[channel_url]['found'] = len(video_urls)
+            for video_url in video_urls:
+                future = video_pipeline.submit(video_url, use_similarity_check, options['days'], options['lang'])
+                video_futures[future] = (channel_url, video_url)
+
+        for future in as_completed(video_futures):
+            channel_url, video_url = video_futures[future]
+            channel_stats = stats[channel_url]
+            channel_stats['finished_at'] = time.time()
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"處理影片時發生錯誤 {video_url}：{e}")
+                channel_stats['failed'] += 1
+                continue
+            channel_stats[result['status']] += 1
+            channel_stats['results'].append(result)
+            if result['status'] != 'skipped':
+                channel_stats['audio_seconds'] += result['duration']
+
+    # 僅推進全部影片都成功處理的頻道的同步進度
+    for channel_url, channel_stats in stats.items():
+        if channel_stats['failed'] == 0:
+            update_channel_sync_state(metadata_store, channel_url, channel_stats['newest_entry'], channel_stats['results'])
+    metadata_store.close()
+
+    print_batch_summary(stats, batch_start)
+
+def print_batch_summary(stats, batch_start):
+    """列出每個頻道的處理數量、耗時與處理速度（影片長度相對於實際耗時的倍數）"""
+    print("\n===== 批次處理摘要 =====")
+    for channel_url, s in stats.items():
+        elapsed = s['finished_at'] - batch_start
+        processed = s['subtitles'] + s['transcribed']
+        throughput = s['audio_seconds'] / elapsed if elapsed > 0 else 0.0
+        print(f"{channel_url}\n"
+              f"    找到 {s['found']} 部，字幕 {s['subtitles']} 部，轉錄 {s['transcribed']} 部，"
+              f"跳過 {s['skipped']} 部，失敗 {s['failed']} 部\n"
+              f"    完成 {processed} 部，耗時 {elapsed:.1f} 秒，處理速度 {throughput:.1f} 倍即時")
+    print(f"總耗時：{time.time() - batch_start:.1f} 秒")
+
+
+def parse_vtt_timestamp(timestamp):
+    """將 VTT 的 HH:MM:SS.mmm（或 MM:SS.mmm）轉為秒數"""
+    seconds = 0.0
+    for part in timestamp.split(':'):
+        seconds = seconds * 60 + float(part)
+    return seconds
 
 
 def clean_subtitles(subtitle_file):
-    """從字幕文件中去除時間戳和空行"""
+    """從字幕文件中去除時間戳和空行，並保留每段字幕的時間，返回 (純文字, 段落列表)"""
     cleaned_lines = []
+    segments = []
     with open(subtitle_file, 'r', encoding='utf-8') as f:
         transcription_text = f.read().splitlines()
         timestamp_pattern_vtt = re.compile(r'^\d{2}:\d{2}:\d{2}\.\d{3} --> \d{2}:\d{2}:\d{2}\.\d{3}$')
+        # 時間行後面可能接著位置等設定，例如 "align:start position:0%"
+        cue_pattern = re.compile(r'^((?:\d+:)?\d{2}:\d{2}\.\d{3}) --> ((?:\d+:)?\d{2}:\d{2}\.\d{3})')
+        cue = None
         for line in transcription_text:
+            cue_match = cue_pattern.match(line)
+            if cue_match:
+                cue = {'start': parse_vtt_timestamp(cue_match.group(1)), 'end': parse_vtt_timestamp(cue_match.group(2)), 'lines': []}
+                segments.append(cue)
+            elif line.strip() == '':
+                cue = None
+            elif cue is not None:
+                cue['lines'].append(re.sub(r'<[^>]+>', '', line).strip())
             # 檢查這行是否是時間戳格式的行，並排除空行
             if not timestamp_pattern_vtt.match(line) and line.strip() != '':
                 cleaned_lines.append(line)
     cleaned_text = '\n'.join(cleaned_lines)
+    segments = [{'start': cue['start'], 'end': cue['end'], 'text': ' '.join(filter(None, cue['lines']))}
+                for cue in segments if any(cue['lines'])]
     print(f"字幕清理完成，純文字內容已提取。")
-    return cleaned_text
+    return cleaned_text, segments
 
 
-def extract_video_info(video_url):
-    """提取影片的基本信息"""
-    with YoutubeDL({'quiet': True}) as ydl:
-        info = ydl.extract_info(video_url, download=False)
-    
-    channel_name = info.get('uploader', 'Unknown Channel')
-    upload_date = datetime.strptime(info['upload_date'], '%Y%m%d')
-    original_url = f"https://www.youtube.com/watch?v={info.get('id')}"
-    video_title = info.get('title', 'Unknown')
-    video_title = re.sub(r'[\/:*?"<>|]', '_', video_title)
+def extract_video_info(info_dict):
+    """從已提取的影片資訊中取出基本信息"""
+    channel_name = info_dict.get('uploader', 'Unknown Channel')
+    upload_date = datetime.strptime(info_dict['upload_date'], '%Y%m%d')
+    original_url = f"https://www.youtube.com/watch?v={info_dict.get('id')}"
+    video_title = info_dict['title']  # get_video_info 已清理過檔名中的非法字元
     
     return channel_name, video_title, upload_date, original_url
 
 
-def save_transcription(transcription_text, output_dir, channel_name, upload_date, video_title):
-    """儲存轉錄文字到檔案"""
+def save_transcription(transcription_text, output_dir, channel_name, upload_date, video_title, segments=None):
+    """儲存轉錄文字到檔案；有時間資訊時另存段落檔（.segments.jsonl）"""
+    # 空的逐字稿不存檔，避免影片被當成已完成而不再重試
+    if not transcription_text.strip():
+        raise ValueError(f"逐字稿沒有內容，不儲存：{video_title}")
+
     transcript_dir = os.path.join(output_dir, channel_name)
     os.makedirs(transcript_dir, exist_ok=True)
 
@@ -327,41 +556,91 @@ def save_transcription(transcription_text, output_dir, channel_name, upload_date
     with open(transcript_path, 'w', encoding='utf-8') as f:
         f.write(transcription_text)
     
+    if segments:
+        write_segments(transcript_path, segments)
+
     print(f"轉錄完成！文字稿已儲存到: {transcript_path}")
+
+    # 同步更新全文檢索索引；索引失敗不影響逐字稿本身，之後搜尋時會再補上
+    try:
+        get_search_index(os.path.join(output_dir, 'search_index.db')).index_file(
+            transcript_path, transcription_text, channel_name, video_title)
+    except Exception as e:
+        print(f"更新全文檢索索引失敗：{e}")
+
+    # 有安裝向量模型套件時同時建立聊天檢索用的向量索引，跨集數提問時不需再計算
+    if TranscriptRetriever.is_available():
+        try:
+            get_retriever(os.path.join(output_dir, '.vector_index')).get_index(transcript_path)
+        except Exception as e:
+            print(f"建立向量索引失敗：{e}")
     
     return transcript_path
 
 
-def update_metadata(metadata, channel_name, video_title, upload_date, original_url, transcript_path):
-    """更新元數據字典並包括逐字稿路徑"""
-    if channel_name not in metadata:
-        metadata[channel_name] = {}
-    
-    metadata[channel_name][video_title] = {
-        'upload_date': upload_date.strftime('%Y-%m-%d'),
-        'original_url': original_url,
-        'transcript_path': transcript_path  # 新增這一行來儲存逐字稿的路徑
-    }
+def update_metadata(metadata_store, channel_name, video_title, upload_date, original_url, transcript_path):
+    """更新單部影片的元數據並包括逐字稿路徑（以影片 ID 為鍵 upsert）"""
+    metadata_store.upsert_video(
+        channel_name, video_title, upload_date.strftime('%Y-%m-%d'), original_url, transcript_path,
+        video_id=extract_video_id(original_url),
+    )
+    print(f"元數據已更新：{channel_name} / {video_title}")
 
 
+def search_transcripts(query, output_dir, limit=10):
+    """在所有逐字稿中搜尋關鍵字，列出排序後的集數與片段"""
+    search_index = get_search_index(os.path.join(output_dir, 'search_index.db'))
+    updated = search_index.sync_directory(output_dir)
+    if updated:
+        print(f"已更新 {updated} 份逐字稿的索引")
+
+    start_time = time.time()
+    results = search_index.search(query, limit=limit)
+    print(f"找到 {len(results)} 筆結果（{(time.time() - start_time) * 1000:.1f} 毫秒）")
+    for rank, result in enumerate(results, 1):
+        print(f"{rank}. [{result['score']:.2f}] {result['channel_name']} / {result['title']}")
+        print(f"   {result['snippet']}")
+        print(f"   {result['path']}")
+    return results
+
 def main():
     # 設定 argparse 來解析命令列參數
     parser = argparse.ArgumentParser(description="處理 YouTube 頻道或單個影片的轉錄和字幕下載")
-    parser.add_argument('mode', choices=['channel', 'single'], help="選擇要處理的模式：'channel' 處理頻道影片，'single' 處理單個影片")
-    parser.add_argument('url', help="YouTube 頻道 URL 或影片 URL")
+    parser.add_argument('mode', choices=['channel', 'single', 'batch', 'search'], help="選擇要處理的模式：'channel' 處理頻道影片，'single' 處理單個影片，'batch' 處理頻道清單檔案中的所有頻道，'search' 搜尋所有逐字稿內容")
+    parser.add_argument('url', help="YouTube 頻道 URL、影片 URL、batch 模式下的頻道清單檔案路徑，或 search 模式下的搜尋關鍵字")
     parser.add_argument('--output_dir', default='./transcriptions', help="輸出目錄，預設為 './transcriptions'")
-    parser.add_argument('--metadata_path', default='./transcriptions/metadata.json', help="元數據位置，預設為 './transcriptions/metadata.json'")
+    parser.add_argument('--metadata_path', default='./transcriptions/metadata.db', help="元數據資料庫位置，預設為 './transcriptions/metadata.db'（首次建立時會自動匯入同名的 metadata.json）")
+    parser.add_argument('--download_workers', type=int, default=3, help="頻道及批次模式下同時下載字幕與音訊的執行緒數，預設為 3")
+    parser.add_argument('--transcribe_workers', type=int, default=1, help="頻道及批次模式下同時進行轉錄的執行緒數，預設為 1")
+    parser.add_argument('--full_sync', action='store_true', help="忽略已記錄的頻道同步進度，重新檢查最近的影片")
+    parser.add_argument('--audio_mode', choices=['pcm', 'mp3'], default='pcm', help="音訊處理方式：'pcm' 保留原始音訊並在轉錄時直接解碼成 16 kHz PCM（預設），'mp3' 先轉成 192 kbps MP3")
+    parser.add_argument('--vad', choices=VAD_MODES, default='energy', help="轉錄前的人聲偵測：'energy' 依音量（預設），'webrtc' 使用 WebRTC VAD 模型（需安裝 webrtcvad，較能略過音樂），'off' 轉錄整段音訊")
+    parser.add_argument('--asr_backend', choices=ASR_BACKENDS, default='hf', help="轉錄引擎：'hf' 為 transformers（預設），'hf-int8' 為動態 int8 量化的 transformers，'ctranslate2' 使用 faster-whisper（需另外安裝）")
+    parser.add_argument('--asr_model', default='medium', help="Whisper 模型大小（tiny、base、small、medium、large-v3）或完整的模型名稱，預設為 medium")
+    parser.add_argument('--asr_threads', type=int, help="轉錄使用的 CPU 執行緒數（多程序時為每個程序的執行緒數），預設自動決定")
+    parser.add_argument('--asr_processes', type=int, default=1, help="同一部影片分段後同時轉錄的程序數，預設為 1；每個程序各自載入一份模型")
+    parser.add_argument('--limit', type=int, default=10, help="search 模式下列出的結果數，預設為 10")
     args = parser.parse_args()
     
     # 設定輸出目錄
     output_dir = args.output_dir
     os.makedirs(output_dir, exist_ok=True)
+    transcribe_options = {'vad': args.vad, 'asr_backend': args.asr_backend, 'asr_model': args.asr_model,
+                          'asr_threads': args.asr_threads, 'asr_processes': args.asr_processes}
 
     # 根據 mode 選擇處理方法
     if args.mode == 'channel':
-        process_channel_videos(args.url, output_dir, args.metadata_path)
+        process_channel_videos(args.url, output_dir, args.metadata_path,
+                               download_workers=args.download_workers, transcribe_workers=args.transcribe_workers,
+                               full_sync=args.full_sync, audio_mode=args.audio_mode, transcribe_options=transcribe_options)
     elif args.mode == 'single':
-        process_single_video(args.url, output_dir, args.metadata_path)
+        process_single_video(args.url, output_dir, args.metadata_path, audio_mode=args.audio_mode, transcribe_options=transcribe_options)
+    elif args.mode == 'batch':
+        process_channel_batch(args.url, output_dir, args.metadata_path,
+                              download_workers=args.download_workers, transcribe_workers=args.transcribe_workers,
+                              full_sync=args.full_sync, audio_mode=args.audio_mode, transcribe_options=transcribe_options)
+    elif args.mode == 'search':
+        search_transcripts(args.url, output_dir, limit=args.limit)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file